@@ -0,0 +1,136 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import config
+
+
+class AgentRecorder:
+    """
+    Array-backed replacement for the agent-level mesa DataCollector.
+
+    Every stride steps the opinions of the recorded agents are written into
+    one row of a preallocated (snapshots x agents) array. When a spill_path
+    is given, full blocks of block_size snapshots are saved there and the
+    buffer is reused, so that long runs keep a bounded amount in memory,
+    otherwise the buffer grows when it fills up.
+    """
+
+    def __init__(
+        self, model, stride=100, agent_ids=None, block_size=None, spill_path=None
+    ):
+        """
+        Args:
+            model (SocialModel): model whose agents are recorded
+            stride (int): record every stride steps
+            agent_ids (list): unique_ids of the agents to record, all if None
+            block_size (int): snapshots per block, by default all the
+                snapshots of a config.simulation_periods long run
+            spill_path (str): directory the full blocks are saved to
+        """
+        self.stride = stride
+        self.spill_path = spill_path
+
+        all_ids = [a.unique_id for a in model.get_agents()]
+        if agent_ids is None:
+            agent_ids = all_ids
+        self.agent_ids = np.array(agent_ids)
+        # Positions of the recorded agents within model.get_opinions()
+        position = {unique_id: i for i, unique_id in enumerate(all_ids)}
+        self.positions = np.array([position[i] for i in agent_ids], dtype=np.int64)
+
+        if block_size is None:
+            block_size = config.simulation_periods // stride + 1
+        self.opinions = np.empty((block_size, len(self.agent_ids)))
+        self.steps = np.empty(block_size, dtype=np.int64)
+        self.count = 0
+        self.spilled_blocks = 0
+
+        if spill_path is not None:
+            os.makedirs(spill_path, exist_ok=True)
+
+    def collect(self, model):
+        if model.schedule.steps % self.stride != 0:
+            return
+
+        if self.count == len(self.steps):
+            if self.spill_path is not None:
+                self.spill()
+            else:
+                self.opinions = np.concatenate([self.opinions, np.empty_like(self.opinions)])
+                self.steps = np.concatenate([self.steps, np.empty_like(self.steps)])
+
+        self.opinions[self.count] = model.get_opinions()[self.positions]
+        self.steps[self.count] = model.schedule.steps
+        self.count += 1
+
+    def get_state(self):
+        return {
+            "opinions": self.opinions[: self.count].copy(),
+            "steps": self.steps[: self.count].copy(),
+            "spilled_blocks": self.spilled_blocks,
+        }
+
+    def set_state(self, state):
+        """
+        Restores the snapshots of get_state, the blocks it had spilled are
+        expected to still be in spill_path
+        """
+        self.count = len(state["steps"])
+        if self.count > len(self.steps):
+            self.opinions = np.empty((self.count, len(self.agent_ids)))
+            self.steps = np.empty(self.count, dtype=np.int64)
+        self.opinions[: self.count] = state["opinions"]
+        self.steps[: self.count] = state["steps"]
+        self.spilled_blocks = state["spilled_blocks"]
+
+    def spill(self):
+        """
+        Saves the buffered snapshots as the next block in spill_path
+        """
+        np.save(self.get_block_path("opinions"), self.opinions[: self.count])
+        np.save(self.get_block_path("steps"), self.steps[: self.count])
+        self.spilled_blocks += 1
+        self.count = 0
+
+    def get_block_path(self, name, block=None):
+        block = self.spilled_blocks if block is None else block
+        return os.path.join(self.spill_path, f"{name}_{block}.npy")
+
+    def get_records(self):
+        """
+        Returns:
+            steps (np.ndarray): the step of every snapshot
+            opinions (np.ndarray): (snapshots x agents) opinions
+        """
+        steps = [
+            np.load(self.get_block_path("steps", block))
+            for block in range(self.spilled_blocks)
+        ]
+        opinions = [
+            np.load(self.get_block_path("opinions", block), mmap_mode="r")
+            for block in range(self.spilled_blocks)
+        ]
+        steps.append(self.steps[: self.count])
+        opinions.append(self.opinions[: self.count])
+
+        return np.concatenate(steps), np.concatenate(opinions)
+
+    def get_agent_vars_dataframe(self):
+        """
+        Returns:
+            pd.DataFrame: step and opinion columns indexed by (Step, AgentID),
+                the layout of mesa's DataCollector.get_agent_vars_dataframe
+        """
+        steps, opinions = self.get_records()
+        num_agents = len(self.agent_ids)
+
+        index = pd.MultiIndex.from_arrays(
+            [np.repeat(steps, num_agents), np.tile(self.agent_ids, len(steps))],
+            names=["Step", "AgentID"],
+        )
+        return pd.DataFrame(
+            {"step": np.repeat(steps, num_agents), "opinion": opinions.ravel()},
+            index=index,
+        )
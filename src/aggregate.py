@@ -0,0 +1,132 @@
+import os
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+
+class RunningAggregate:
+    """
+    Per-step running statistics of the model series of one parameter
+    combination, updated one run at a time so that the mean curves and
+    confidence bands never need the raw replicates to be reloaded.
+
+    Keeps the count, mean and sum of squared deviations (Welford) of every
+    (step, column), and optionally a reservoir of up to reservoir_size whole
+    runs as a sketch for the quantiles, which is exact as long as no more
+    runs than that have been added.
+    """
+
+    def __init__(self, columns, num_steps, reservoir_size=0, seed=0):
+        self.columns = list(columns)
+        self.seed = seed
+        self.count = 0
+        self.seeds = []
+        self.mean = np.zeros((num_steps, len(self.columns)))
+        self.m2 = np.zeros((num_steps, len(self.columns)))
+        self.reservoir = np.empty((reservoir_size, num_steps, len(self.columns)))
+
+    def update(self, model_df, seed=None):
+        """
+        Adds one run, runs whose seed was already added are skipped
+
+        Args:
+            model_df (pd.DataFrame): get_model_vars_dataframe() of the run
+            seed (int): seed of the run
+        """
+        if seed is not None:
+            if seed in self.seeds:
+                return
+            self.seeds.append(seed)
+
+        values = model_df[self.columns].to_numpy(dtype=float)
+        if values.shape != self.mean.shape:
+            raise ValueError(
+                f"Run has {len(values)} steps, the aggregate has {len(self.mean)}"
+            )
+
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (values - self.mean)
+
+        # Reservoir sampling (algorithm R) over whole runs
+        reservoir_size = len(self.reservoir)
+        if self.count <= reservoir_size:
+            self.reservoir[self.count - 1] = values
+        elif reservoir_size:
+            slot = np.random.default_rng([self.seed, self.count]).integers(self.count)
+            if slot < reservoir_size:
+                self.reservoir[slot] = values
+
+    def variance(self):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.m2 / (self.count - 1)
+
+    def summary(self, confidence=0.95, quantiles=()):
+        """
+        Returns:
+            pd.DataFrame: the mean of every column per step, as averaged by
+                get_MIM_df, followed by <column>_std, <column>_ci_low and
+                <column>_ci_high and, from the reservoir, <column>_q<quantile>
+        """
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        std = np.sqrt(self.variance())
+        half_width = z * std / np.sqrt(self.count)
+
+        frames = [
+            pd.DataFrame(self.mean, columns=self.columns),
+            pd.DataFrame(std, columns=[f"{c}_std" for c in self.columns]),
+            pd.DataFrame(
+                self.mean - half_width, columns=[f"{c}_ci_low" for c in self.columns]
+            ),
+            pd.DataFrame(
+                self.mean + half_width, columns=[f"{c}_ci_high" for c in self.columns]
+            ),
+        ]
+
+        samples = self.reservoir[: min(self.count, len(self.reservoir))]
+        for q in quantiles:
+            if len(samples) == 0:
+                break
+            frames.append(
+                pd.DataFrame(
+                    np.quantile(samples, q, axis=0),
+                    columns=[f"{c}_q{q}" for c in self.columns],
+                )
+            )
+
+        return pd.concat(frames, axis=1)
+
+    def save(self, path):
+        # Write next to the target first so an interrupted sweep never leaves a partial file
+        temp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            temp_path,
+            columns=np.array(self.columns),
+            seed=self.seed,
+            count=self.count,
+            seeds=np.array(self.seeds, dtype=np.int64),
+            mean=self.mean,
+            m2=self.m2,
+            reservoir=self.reservoir[: min(self.count, len(self.reservoir))],
+            reservoir_size=len(self.reservoir),
+        )
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            num_steps = data["mean"].shape[0]
+            aggregate = cls(
+                data["columns"].tolist(),
+                num_steps,
+                int(data["reservoir_size"]),
+                int(data["seed"]),
+            )
+            aggregate.count = int(data["count"])
+            aggregate.seeds = data["seeds"].tolist()
+            aggregate.mean = data["mean"]
+            aggregate.m2 = data["m2"]
+            aggregate.reservoir[: len(data["reservoir"])] = data["reservoir"]
+        return aggregate
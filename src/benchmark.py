@@ -0,0 +1,277 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import networkx as nx
+
+import config
+from metric import Metric
+from network import (
+    generate_ego_network,
+    increase_clustering_coefficient,
+    modify_reciprocity,
+)
+from social_model import SocialModel
+
+METRIC_FUNCTIONS = {
+    "collect": lambda opinions, agent_types: Metric.collect(opinions, agent_types),
+    "misinformation": lambda opinions, agent_types: Metric.misinformation(opinions),
+    "polarization": lambda opinions, agent_types: Metric.polarization(opinions),
+    "average_opinion_all": lambda opinions, agent_types: Metric.average_opinion_all(opinions),
+    "average_opinion_left": Metric.average_opinion_left,
+    "average_opinion_right": Metric.average_opinion_right,
+    "average_opinion_reg": Metric.average_opinion_reg,
+}
+
+# Dependencies of the notebooks and the plotting code, which the simulation
+# core is not supposed to load
+HEAVY_MODULES = ("scipy", "matplotlib", "ipysigma", "ipywidgets")
+
+# Imports the modules in a fresh interpreter and reports how long it took
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+for module in sys.argv[2:]:
+    __import__(module)
+seconds = time.perf_counter() - start
+heavy = sys.argv[1].split(",")
+print(json.dumps({"seconds": seconds, "heavy_modules": [m for m in heavy if m in sys.modules]}))
+"""
+
+
+def time_call(fn, repeat=1):
+    """
+    Returns:
+        dict: best and mean wall-clock seconds of repeat calls of fn
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        # The model and the network routines report their progress on stdout
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn()
+        timings.append(time.perf_counter() - start)
+    return {"best": min(timings), "mean": sum(timings) / len(timings)}
+
+
+def build_graph(n, seed=0):
+    # Same generator as the synthetic networks of network_synth.ipynb
+    return generate_ego_network(n, 3, 0.5, seed).to_directed()
+
+
+def build_model(G, exp, engine, seed=0):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return SocialModel(
+            G,
+            seed=seed,
+            exp=exp,
+            flooding_capacity=25,
+            bot_follower_percentage=0.3,
+            activation_delay=0,
+            inoculation_rate=0.2,
+            inoculation_range=[0.2, 0.8],
+            from_scratch=True,
+            param_index=seed,
+            collect_agent_data=False,
+            engine=engine,
+        )
+
+
+def bench_steps(sizes, exps=(1, 2, 3), engines=("object", "vector"), steps=50, seed=0):
+    """
+    Throughput of SocialModel.step for every network size, experiment and engine
+    """
+    results = []
+    for n in sizes:
+        G = build_graph(n, seed)
+        for exp in exps:
+            for engine in engines:
+                setup = time_call(lambda: build_model(G, exp, engine, seed))
+                model = build_model(G, exp, engine, seed)
+
+                def run():
+                    for _ in range(steps):
+                        model.step()
+
+                timing = time_call(run)
+                results.append(
+                    {
+                        "benchmark": "step",
+                        "nodes": n,
+                        "exp": exp,
+                        "engine": engine,
+                        "steps": steps,
+                        "setup_seconds": setup["best"],
+                        "seconds": timing["best"],
+                        "steps_per_second": steps / timing["best"],
+                        "agent_steps_per_second": steps
+                        * model.schedule.get_agent_count()
+                        / timing["best"],
+                    }
+                )
+    return results
+
+
+def bench_metrics(sizes, repeat=20, seed=0):
+    """
+    Time of every Metric function on the opinions of a freshly built model
+    """
+    results = []
+    for n in sizes:
+        model = build_model(build_graph(n, seed), 1, "object", seed)
+        opinions = model.get_opinions()
+        agent_types = model.get_agent_types()
+
+        for name, fn in METRIC_FUNCTIONS.items():
+            timing = time_call(lambda: fn(opinions, agent_types), repeat)
+            results.append(
+                {
+                    "benchmark": "metric",
+                    "function": name,
+                    "nodes": n,
+                    "seconds": timing["best"],
+                    "mean_seconds": timing["mean"],
+                }
+            )
+    return results
+
+
+def bench_network(sizes, clustering_increase=0.05, seed=0):
+    """
+    Time of the graph-shaping routines, raising the transitivity of the
+    undirected graph by clustering_increase and lowering the reciprocity of
+    the directed one
+    """
+    results = []
+    for n in sizes:
+        G = generate_ego_network(n, 3, 0.5, seed)
+        target = nx.transitivity(G) + clustering_increase
+        timing = time_call(lambda: increase_clustering_coefficient(G, target))
+        results.append(
+            {
+                "benchmark": "network",
+                "function": "increase_clustering_coefficient",
+                "nodes": n,
+                "target_transitivity": target,
+                "seconds": timing["best"],
+            }
+        )
+
+        D = build_graph(n, seed)
+        timing = time_call(lambda: modify_reciprocity(D))
+        results.append(
+            {
+                "benchmark": "network",
+                "function": "modify_reciprocity",
+                "nodes": n,
+                "seconds": timing["best"],
+            }
+        )
+    return results
+
+
+def bench_startup(modules=("sweep",), repeat=5):
+    """
+    Import time of the simulation modules in a fresh interpreter, i.e. the
+    startup cost of a sweep worker which does not inherit them, and the heavy
+    dependencies (HEAVY_MODULES) they load
+    """
+    results = []
+    for module in modules:
+        timings = []
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, "-c", STARTUP_SCRIPT, ",".join(HEAVY_MODULES), module],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            timings.append(json.loads(output))
+        results.append(
+            {
+                "benchmark": "startup",
+                "module": module,
+                "seconds": min(t["seconds"] for t in timings),
+                "heavy_modules": timings[0]["heavy_modules"],
+            }
+        )
+    return results
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes, suites=("step", "metric", "network", "startup"), **kwargs):
+    """
+    Returns:
+        dict: the environment of the run and one record per measurement,
+            ready to be dumped as JSON and compared across commits
+    """
+    results = []
+    if "step" in suites:
+        results += bench_steps(
+            sizes,
+            exps=kwargs.get("exps", (1, 2, 3)),
+            engines=kwargs.get("engines", ("object", "vector")),
+            steps=kwargs.get("steps", 50),
+        )
+    if "metric" in suites:
+        results += bench_metrics(sizes, repeat=kwargs.get("repeat", 20))
+    if "network" in suites:
+        results += bench_network(sizes)
+    if "startup" in suites:
+        results += bench_startup(repeat=kwargs.get("repeat", 20))
+
+    return {
+        "commit": get_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "communication_speed": config.communication_speed,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the simulation")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 2000, 8000])
+    parser.add_argument(
+        "--suites", nargs="+", default=["step", "metric", "network", "startup"],
+        choices=["step", "metric", "network", "startup"],
+    )
+    parser.add_argument("--exps", type=int, nargs="+", default=[1, 2, 3])
+    parser.add_argument(
+        "--engines", nargs="+", default=["object", "vector"], choices=["object", "vector"]
+    )
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="JSON file to write, stdout if omitted")
+    args = parser.parse_args()
+
+    report = run_benchmarks(
+        args.sizes,
+        args.suites,
+        exps=args.exps,
+        engines=args.engines,
+        steps=args.steps,
+        repeat=args.repeat,
+    )
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
@@ -29,3 +29,50 @@ inoculation_rates = [0.5, 0.8]
 # exp = [1, 2, 3]
 exp = [3]
 activation_delays = [100, 200, 500]
+# "object" steps every agent through mesa, "vector" uses the array-based VectorEngine
+engine = "object"
+# Steps between two snapshots of every agent's opinion
+agent_data_stride = 100
+
+network_path = "data/networks/ego_net.csv"
+# A sweep writing to results_path keeps its results store in results_path/store,
+# the index of its finished runs by the hash of their parameters, config and
+# network in results_path/cache and its checkpoints in results_path/checkpoints
+results_path = "data/results/MIM"
+# Store read by data.get_MIM_df, the one of a sweep writing to results_path
+results_store_path = f"{results_path}/store"
+# In-flight runs save their state every checkpoint_interval steps, 0 disables checkpoints
+checkpoint_interval = 100
+# Runs stop once every metric of convergence_tolerances has changed by at most
+# its tolerance over the last convergence_window steps, 0 disables the check
+convergence_window = 0
+convergence_tolerances = {
+    "polarization": 1e-4,
+    "misinformation": 1e-4,
+    "average_opinion_all": 1e-4,
+    "average_opinion_left": 1e-4,
+    "average_opinion_right": 1e-4,
+    "average_opinion_reg": 1e-4,
+}
+# Repeat the last row of a run which stopped early up to simulation_periods,
+# so that its series lines up with the others (and with its aggregate)
+convergence_pad = True
+# Runs kept per parameter combination for the quantiles of get_MIM_aggregate, 0 disables them
+aggregate_reservoir_size = 0
+# SocialModel arguments swept over by main.py, every combination is run simulation_number times
+sweep_grid = {
+    "exp": exp,
+    "bot_follower_percentage": bot_follower_percentage,
+}
+# SocialModel arguments held fixed during the sweep
+sweep_defaults = {
+    "flooding_capacity": 25,
+    "activation_delay": 0,
+    "inoculation_rate": 0.2,
+    "inoculation_range": [0.2, 0.8],
+}
+# Number of worker processes for the sweep, None uses every core
+sweep_workers = None
+# Run the runs which only differ in their activation_delay from one shared
+# trunk, forked at each activation step (see sweep.execute_branches)
+sweep_branching = True
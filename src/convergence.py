@@ -0,0 +1,55 @@
+from collections import deque
+
+
+class ConvergenceMonitor:
+    """
+    Watches Metric series over a sliding window, they have converged once
+    every one of them has stayed within its tolerance (max - min) over the
+    last window steps, and records the step at which that happened
+    """
+
+    def __init__(self, window, tolerances):
+        """
+        Args:
+            window (int): number of consecutive steps the metrics must settle for
+            tolerances (dict): metric name -> largest change allowed over the window
+        """
+        self.window = window
+        self.tolerances = dict(tolerances)
+        self.history = {name: deque(maxlen=window) for name in self.tolerances}
+        self.converged_step = None
+
+    def update(self, metrics, step):
+        """
+        Args:
+            metrics (dict): Metric.collect of the current step
+            step (int): the current step
+
+        Returns:
+            bool: whether the metrics have converged
+        """
+        if self.converged_step is not None:
+            return True
+
+        for name, values in self.history.items():
+            values.append(metrics[name])
+
+        settled = all(
+            len(values) == self.window
+            and max(values) - min(values) <= self.tolerances[name]
+            for name, values in self.history.items()
+        )
+        if settled:
+            self.converged_step = step
+        return settled
+
+    def get_state(self):
+        return {
+            "history": {name: list(values) for name, values in self.history.items()},
+            "converged_step": self.converged_step,
+        }
+
+    def set_state(self, state):
+        for name, values in state["history"].items():
+            self.history[name] = deque(values, maxlen=self.window)
+        self.converged_step = state["converged_step"]
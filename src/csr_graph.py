@@ -0,0 +1,238 @@
+import hashlib
+import os
+from multiprocessing import shared_memory
+
+import networkx as nx
+import numpy as np
+
+
+class CSRGraph:
+    """
+    Compressed sparse row (CSR) adjacency of a graph whose nodes are labelled
+    0..n-1, the out-neighbors of node i are indices[indptr[i]:indptr[i + 1]]
+
+    node_ids optionally keeps the original label of every contiguous node id,
+    sources the source node of every entry in indices once row_ids built it
+    """
+
+    def __init__(self, indptr, indices, node_ids=None, sources=None):
+        self.indptr = indptr
+        self.indices = indices
+        self.node_ids = node_ids
+        self.sources = sources
+
+    @classmethod
+    def from_networkx(cls, G, relabel=False):
+        """
+        Args:
+            G (nx.Graph): graph with integer nodes 0..n-1, the same labelling
+                the agents' unique_ids rely on
+            relabel (bool): accept any sortable labels instead, mapping them to
+                0..n-1 in sorted order (the identity for 0..n-1 labels)
+
+        Returns:
+            CSRGraph: neighbors are stored in the order networkx iterates them
+        """
+        n = G.number_of_nodes()
+        if relabel:
+            node_ids = np.array(sorted(G.nodes))
+            node_index = {node: i for i, node in enumerate(node_ids.tolist())}
+        else:
+            node_ids = np.arange(n)
+            node_index = None
+        nodes = node_ids.tolist()
+
+        degrees = np.fromiter((len(G.adj[u]) for u in nodes), dtype=np.int64, count=n)
+
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(degrees, out=indptr[1:])
+
+        neighbors = (v for u in nodes for v in G.adj[u])
+        if node_index is not None:
+            neighbors = (node_index[v] for v in neighbors)
+        indices = np.fromiter(neighbors, dtype=np.int64, count=indptr[-1])
+        return cls(indptr, indices, node_ids)
+
+    @classmethod
+    def from_edges(cls, sources, targets, num_nodes, node_ids=None):
+        """
+        Args:
+            sources, targets (np.ndarray): node ids 0..num_nodes-1 of every edge
+            node_ids (np.ndarray): original label of every node id
+
+        Returns:
+            CSRGraph: neighbors of every node in the order of the edge list
+        """
+        sources = np.asarray(sources)
+        indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=num_nodes), out=indptr[1:])
+
+        order = np.argsort(sources, kind="stable")
+        indices = np.asarray(targets, dtype=np.int64)[order]
+        return cls(indptr, indices, node_ids)
+
+    def to_networkx(self):
+        """
+        Returns:
+            nx.DiGraph: graph with the original node labels, whose adjacency
+                iterates neighbors in the same order as this CSR
+        """
+        node_ids = self.node_ids
+        if node_ids is None:
+            node_ids = np.arange(self.number_of_nodes())
+        sources = node_ids[self.row_ids()]
+        targets = node_ids[self.indices]
+
+        G = nx.DiGraph()
+        G.add_nodes_from(node_ids.tolist())
+        G.add_edges_from(zip(sources.tolist(), targets.tolist()))
+        return G
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "indptr.npy"), self.indptr)
+        np.save(os.path.join(directory, "indices.npy"), self.indices)
+        np.save(os.path.join(directory, "node_ids.npy"), self.node_ids)
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        """
+        Loads a graph written by save, memory-mapped read-only by default
+        """
+        return cls(
+            np.load(os.path.join(directory, "indptr.npy"), mmap_mode=mmap_mode),
+            np.load(os.path.join(directory, "indices.npy"), mmap_mode=mmap_mode),
+            np.load(os.path.join(directory, "node_ids.npy"), mmap_mode=mmap_mode),
+        )
+
+    def fingerprint(self):
+        """
+        Returns:
+            str: sha256 of the adjacency (node count and neighbor order), the
+                same for every copy of the graph however it was loaded
+        """
+        sha256 = hashlib.sha256()
+        for array in (self.indptr, self.indices):
+            sha256.update(np.ascontiguousarray(array, dtype=np.int64).tobytes())
+        return sha256.hexdigest()
+
+    def number_of_nodes(self):
+        return len(self.indptr) - 1
+
+    def number_of_edges(self):
+        return len(self.indices)
+
+    def degrees(self):
+        return np.diff(self.indptr)
+
+    def neighbors(self, node):
+        return self.indices[self.indptr[node] : self.indptr[node + 1]]
+
+    def bfs(self, source):
+        """
+        Level-synchronous breadth-first search following out-neighbors,
+        every level is expanded at once with array operations
+
+        Returns:
+            np.ndarray: hop distance of every node from source, -1 where unreachable
+        """
+        distances = np.full(self.number_of_nodes(), -1, dtype=np.int64)
+        distances[source] = 0
+        frontier = np.array([source], dtype=np.int64)
+
+        depth = 0
+        while len(frontier):
+            depth += 1
+            starts = self.indptr[frontier]
+            counts = self.indptr[frontier + 1] - starts
+            # Positions in indices of the neighbors of every frontier node
+            offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+            offsets += np.arange(len(offsets))
+
+            neighbors = self.indices[offsets]
+            frontier = np.unique(neighbors[distances[neighbors] < 0])
+            distances[frontier] = depth
+        return distances
+
+    def row_ids(self):
+        """
+        Returns:
+            np.ndarray: the source node of every entry in indices, built once
+                and kept as sources (shared with the graph by SharedCSRGraph)
+        """
+        if self.sources is None:
+            self.sources = np.repeat(
+                np.arange(self.number_of_nodes(), dtype=np.int64), self.degrees()
+            )
+        return self.sources
+
+
+class SharedCSRGraph:
+    """
+    Publishes the arrays of a CSRGraph once into shared memory, so that the
+    worker processes of a sweep can attach to the same graph without copying.
+
+    handle is a small picklable description of the blocks to pass to the
+    workers, the blocks are released when the publisher closes (or leaves
+    its with block) at the end of the sweep
+    """
+
+    ARRAYS = ("indptr", "indices", "node_ids", "sources")
+
+    def __init__(self, csr: CSRGraph):
+        self.blocks = []
+        self.handle = {}
+
+        # Built here once rather than by every worker's engine
+        csr.row_ids()
+
+        for name in self.ARRAYS:
+            array = getattr(csr, name)
+            if array is None:
+                continue
+            array = np.ascontiguousarray(array)
+
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+            self.blocks.append(block)
+            self.handle[name] = (block.name, array.shape, array.dtype.str)
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Blocks attached by this process, kept open for as long as the process lives
+# since the arrays handed out by attach_shared_graph point into them
+_attached_blocks = {}
+
+
+def attach_shared_graph(handle):
+    """
+    Args:
+        handle (dict): SharedCSRGraph.handle of the publishing process
+
+    Returns:
+        CSRGraph: read-only view on the shared arrays
+    """
+    arrays = {}
+    for name, (block_name, shape, dtype) in handle.items():
+        if block_name not in _attached_blocks:
+            _attached_blocks[block_name] = shared_memory.SharedMemory(name=block_name)
+        block = _attached_blocks[block_name]
+
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        array.flags.writeable = False
+        arrays[name] = array
+
+    return CSRGraph(
+        arrays["indptr"], arrays["indices"], arrays.get("node_ids"), arrays.get("sources")
+    )
@@ -1,4 +1,5 @@
 import csv
+import json
 import os
 import random
 from glob import glob
@@ -8,7 +9,9 @@ import numpy as np
 import pandas as pd
 
 import config
+from csr_graph import CSRGraph
 from parameter import AgentParameter
+from results_store import ResultsStore, parse_run_name
 from utils import compute_ab, get_intervals
 
 
@@ -77,33 +80,92 @@ def generate_agent_params(seed, agent_number, exp, flooding_capacity, innoculate
     return agent_params
 
 
-def pickle_network(network_path):
-    fb_network = open(f"{network_path}.txt", "r").read()
-    lines = fb_network.split("\n")
+def ingest_edge_list(edge_list_path, store_path=None, chunk_size=1_000_000):
+    """
+    Converts a SNAP-style edge list (one "source target" pair per line,
+    whitespace separated, # comments) into a binary edge store in a single
+    pass over fixed-size chunks, so that only one chunk and the node mapping
+    are ever held in memory
+
+    The store directory holds
+        edges.bin: (source, target) int64 pairs of contiguous node ids
+        node_ids.npy: the original id of every contiguous node id
+        meta.json: number of nodes and edges
+
+    Args:
+        store_path (str): defaults to the edge list path with an .edges extension
+        chunk_size (int): number of lines parsed at a time
+
+    Returns:
+        str: store_path
+    """
+    if store_path is None:
+        store_path = f"{os.path.splitext(edge_list_path)[0]}.edges"
+    os.makedirs(store_path, exist_ok=True)
+    edges_path = os.path.join(store_path, "edges.bin")
+
+    # Original id -> contiguous id, in order of first appearance
+    node_index = {}
+    num_edges = 0
+
+    chunks = pd.read_csv(
+        edge_list_path,
+        sep=r"\s+",
+        comment="#",
+        header=None,
+        usecols=[0, 1],
+        dtype=np.int64,
+        chunksize=chunk_size,
+    )
+    with open(f"{edges_path}.tmp", "wb") as fp:
+        for chunk in chunks:
+            edges = chunk.to_numpy()
+            codes, uniques = pd.factorize(edges.ravel())
+
+            for node in uniques.tolist():
+                if node not in node_index:
+                    node_index[node] = len(node_index)
+            ids = np.fromiter(
+                (node_index[node] for node in uniques.tolist()),
+                dtype=np.int64,
+                count=len(uniques),
+            )
 
-    # df = pd.DataFrame()
-    # temp_df = pd.DataFrame()
+            ids[codes].tofile(fp)
+            num_edges += len(edges)
 
-    processed_edges = []
-    for line_index, line in enumerate(lines):
-        # Chunk data processing by serialising already processed data every 10000 lines
-        if line_index % 10000 == 0:
-            temp_df = pd.DataFrame(processed_edges)
-            processed_edges.clear()
+    os.replace(f"{edges_path}.tmp", edges_path)
+    np.save(
+        os.path.join(store_path, "node_ids.npy"),
+        np.fromiter(node_index, dtype=np.int64, count=len(node_index)),
+    )
+    with open(os.path.join(store_path, "meta.json"), "w") as fp:
+        json.dump({"num_nodes": len(node_index), "num_edges": num_edges}, fp)
 
-            if os.path.exists(f"{network_path}.pkl"):
-                df = pd.read_pickle(f"{network_path}.pkl")
-            else:
-                df = pd.DataFrame()
-                df.to_pickle(f"{network_path}.pkl")
+    return store_path
 
-            df = pd.concat([temp_df, df], axis=0)
-            df.to_pickle(f"{network_path}.pkl")
 
-        edge = line.split(" ")
-        processed_edges.extend([(int(edge[0]), int(edge[1]))])
+def load_edge_store(store_path, mmap_mode="r"):
+    """
+    Returns:
+        edges (np.ndarray): (edges x 2) source and target ids written by
+            ingest_edge_list, memory-mapped read-only by default
+        node_ids (np.ndarray): the original id of every node id
+    """
+    edges = np.memmap(
+        os.path.join(store_path, "edges.bin"), dtype=np.int64, mode=mmap_mode
+    ).reshape(-1, 2)
+    node_ids = np.load(os.path.join(store_path, "node_ids.npy"))
+    return edges, node_ids
 
-    # return network
+
+def edge_store_to_csr(store_path):
+    """
+    Returns:
+        CSRGraph: the directed graph of an edge store, node_ids hold the original ids
+    """
+    edges, node_ids = load_edge_store(store_path)
+    return CSRGraph.from_edges(edges[:, 0], edges[:, 1], len(node_ids), node_ids)
 
 
 def get_SFP_df():
@@ -141,31 +203,44 @@ def get_SFP_df():
     return SFP_df
 
 
-def get_MIM_df(exp: str):
-    """_summary_
+def read_MIM_results(exp: str, columns=None, agent_columns=None, **filters):
+    """
+    Reads the per-run results of an experiment from the results store,
+    falling back to the result_*.csv files of runs made before the store
 
     Args:
-        exp (str): exp_w=
+        exp (str): exp_w=, i.e. the experiment followed by the parameters
+            to filter the runs on, e.g. 3_bfp=0.3 (parameters not given
+            are not filtered on, but the runs found must all share one
+            parameter combination, ResultsStore.find_runs raises otherwise)
+        columns (list): model columns to read, all of them if None
+        agent_columns (list): agent columns to read, all of them if None
+        filters: further partitions to filter on, e.g. w=25 or seed=0
 
     Returns:
-        modeldf: an average of model-wise measurements across 10 experiments
-        agentdf: an average of agnent-wise opinion across 10 experiments
+        model_dfs: list of model-wise measurements, one per run
+        agent_dfs: list of agent-wise opinions, one per run
     """
+    store = ResultsStore(config.results_store_path)
+    filters = {**parse_run_name(exp), **filters}
+
+    model_dfs = store.read_runs("model", columns=columns, **filters)
+    agent_dfs = store.read_runs("agent", columns=agent_columns, **filters)
+
+    if model_dfs or agent_dfs:
+        return model_dfs, agent_dfs
 
     folder_path = f"data/results/MIM/exp_{exp}/"
 
     model_results = glob(folder_path + "result_*.csv")
     agent_results = glob(folder_path + "agent_result_*.csv")
 
-    model_dfs = []
-    agent_dfs = []
-
     for file in model_results:
-        df = pd.read_csv(file, sep=",")
+        df = pd.read_csv(file, sep=",", usecols=columns)
         model_dfs.append(df)
 
     for file in agent_results:
-        df = pd.read_csv(file, sep=",")
+        df = pd.read_csv(file, sep=",", usecols=agent_columns)
 
         # ===================================================
         # df_mod = df.drop(
@@ -179,6 +254,23 @@ def get_MIM_df(exp: str):
         # ===================================================
 
         agent_dfs.append(df)
+
+    return model_dfs, agent_dfs
+
+
+def get_MIM_df(exp: str, columns=None, agent_columns=None, **filters):
+    """_summary_
+
+    Args:
+        exp (str): exp_w=, see read_MIM_results for the remaining arguments
+
+    Returns:
+        modeldf: an average of model-wise measurements across 10 experiments
+        agentdf: an average of agnent-wise opinion across 10 experiments
+    """
+
+    model_dfs, agent_dfs = read_MIM_results(exp, columns, agent_columns, **filters)
+
     if model_dfs:
         merged_df = pd.concat(model_dfs)
         by_row_index = merged_df.groupby(merged_df.index)
@@ -195,44 +287,19 @@ def get_MIM_df(exp: str):
     return MIM_model_df, MIM_agent_df
 
 
-def get_MIM_df_no_merge(exp: str):
+def get_MIM_df_no_merge(exp: str, columns=None, agent_columns=None, **filters):
     """_summary_
 
     Args:
-        exp (str): exp_w=
+        exp (str): exp_w=, see read_MIM_results for the remaining arguments
 
     Returns:
-        modeldf: an average of model-wise measurements across 10 experiments
-        agentdf: an average of agnent-wise opinion across 10 experiments
+        modeldf: the model-wise measurements of each of the 10 experiments
+        agentdf: the agent-wise opinions of each of the 10 experiments
     """
 
-    folder_path = f"data/results/MIM/exp_{exp}/"
-
-    model_results = glob(folder_path + "result_*.csv")
-    agent_results = glob(folder_path + "agent_result_*.csv")
-
-    model_dfs = []
-    agent_dfs = []
-
-    for file in model_results:
-        df = pd.read_csv(file, sep=",")
-        model_dfs.append(df)
-
-    for file in agent_results:
-        df = pd.read_csv(file, sep=",")
-
-        # ===================================================
-        # df_mod = df.drop(
-        #     columns=['opinion_l_bf', 'opinion_r_bf', 'opinion_l_bot', 'opinion_r_bot'])
+    model_dfs, agent_dfs = read_MIM_results(exp, columns, agent_columns, **filters)
 
-        # steps = sum([[s] * (df_mod.shape[0]//11)
-        #             for s in range(0, 1100, 100)], [])
-
-        # df_mod['step'] = steps
-        # df_mod.to_csv(file, index=False)
-        # ===================================================
-
-        agent_dfs.append(df)
     if model_dfs:
         MIM_model_df = model_dfs
         # by_row_index = merged_df.groupby(merged_df.index)
@@ -247,3 +314,27 @@ def get_MIM_df_no_merge(exp: str):
     else:
         MIM_agent_df = None
     return MIM_model_df, MIM_agent_df
+
+
+def get_MIM_aggregate(exp: str, confidence=0.95, quantiles=(), **filters):
+    """
+    Per-step mean curves and confidence bands from the running aggregates
+    the sweep keeps, without loading the individual runs
+
+    Args:
+        exp (str): exp_w=, filtered on as in read_MIM_results
+        confidence (float): coverage of the normal confidence band of the mean
+        quantiles (tuple): quantiles to estimate from the aggregates' reservoirs
+
+    Returns:
+        modeldf: the mean of every model-wise measurement (as get_MIM_df) along
+            with its std, ci_low, ci_high (and quantile) columns, None if no
+            aggregate matches
+        count: number of runs aggregated
+    """
+    store = ResultsStore(config.results_store_path)
+    aggregate = store.read_aggregate(**{**parse_run_name(exp), **filters})
+
+    if aggregate is None:
+        return None, 0
+    return aggregate.summary(confidence, quantiles), aggregate.count
@@ -0,0 +1,89 @@
+import numpy as np
+
+
+class InoculationIndex:
+    """
+    Which agents hold an opinion strictly inside each distinct inoculation
+    range (exp 3), so that an inoculated agent filters its neighbors with a
+    lookup instead of comparing every neighbor's opinion against its range.
+
+    The ranges held by the inoculated agents are numbered 0..K-1, and row K
+    of the masks is all True: every agent is given the row of its range, or
+    K if it is not inoculated, so that the filter of an edge (i, j) is simply
+    masks[range_ids[i], j].
+    """
+
+    def __init__(self, inoculated, low, high):
+        """
+        Args:
+            inoculated (np.ndarray): bool, per agent (indexed by unique_id)
+            low, high (np.ndarray): bounds of each agent's inoculation range
+        """
+        self.num_agents = len(inoculated)
+        bounds = np.stack([low[inoculated], high[inoculated]], axis=1)
+        bounds, ids = np.unique(bounds, axis=0, return_inverse=True)
+        self.low = bounds[:, 0]
+        self.high = bounds[:, 1]
+
+        self.range_ids = np.full(self.num_agents, len(bounds), dtype=np.int64)
+        self.range_ids[inoculated] = ids.ravel()
+        self.uninoculated = ~inoculated
+
+        # Kept current by track/update, for engines updating one agent at a time
+        self.tracked = None
+        self.agent_masks = None
+
+    def masks(self, opinions):
+        """
+        Returns:
+            np.ndarray: (K + 1, agents) bool, whether each agent's opinion
+                lies inside each range, the last row is all True
+        """
+        masks = np.ones((len(self.low) + 1, self.num_agents), dtype=bool)
+        masks[:-1] = (self.low[:, None] < opinions) & (opinions < self.high[:, None])
+        return masks
+
+    def edge_keys(self, rows, cols):
+        """
+        Returns:
+            np.ndarray: flat index into masks(...) of the filter of every edge
+                rows[i] -> cols[i]
+        """
+        return self.range_ids[rows] * self.num_agents + cols
+
+    def filter_edges(self, masks, rows, cols):
+        """
+        Args:
+            masks (np.ndarray): masks(...) of the current opinions
+
+        Returns:
+            np.ndarray: bool, whether agent rows[i] listens to cols[i]
+        """
+        if len(self.low) == 1:
+            # With a single range two bool lookups beat building the keys
+            return self.uninoculated[rows] | masks[0, cols]
+        return masks.ravel()[self.edge_keys(rows, cols)]
+
+    def track(self, opinions):
+        """
+        Starts tracking the masks of these opinions as bytearrays, which are
+        cheaper than numpy arrays to read and write one agent at a time
+        """
+        masks = [bytearray(mask.tobytes()) for mask in self.masks(opinions)]
+        self.tracked = list(zip(masks, self.low.tolist(), self.high.tolist()))
+        self.agent_masks = [masks[k] for k in self.range_ids.tolist()]
+
+    def update(self, unique_id, opinion):
+        """
+        Moves one agent's opinion in the tracked masks after its belief changed
+        """
+        opinion = float(opinion)
+        for mask, low, high in self.tracked:
+            mask[unique_id] = low < opinion < high
+
+    def get_mask(self, unique_id):
+        """
+        Returns:
+            bytearray: tracked mask of the neighbors the agent listens to
+        """
+        return self.agent_masks[unique_id]
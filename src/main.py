@@ -1,79 +1,123 @@
 # %%
 
-from os.path import exists
-
-from tqdm import trange
-
-from social_model import SocialModel
-from utils import *
-
-# from d3blocks import D3Blocks
-
-# get_network_stats(G)
-
-# Specifiy which experiment you want to do
-exps = config.exp
-ws = config.flooding_capacity
-bfps = config.bot_follower_percentage
-nbrs = config.not_ban_range
-ads = config.activation_delays
-iranges = config.inoculation_ranges
-
-for exp in exps:
-    for bfp in bfps:
-        for i in trange(config.simulation_number):
-            G = convert_csv_to_graph(f"data/networks/ego_net.csv", sep=",", whole=True)
-
-            # model_df_path = f"data/results/MIM/exp_{exp}_w={w}/result_{i}.csv"
-            # agent_df_path = f"data/results/MIM/exp_{exp}_w={w}/agent_result_{i}.csv"
-
-            model_df_path = f"data/results/MIM/exp_{exp}_bfp={bfp}/result_{i}.csv"
-            agent_df_path = f"data/results/MIM/exp_{exp}_bfp={bfp}/agent_result_{i}.csv"
-
-            # model_df_path = f'data/results/MIM/exp_{exp}_b=10/result_{i}.csv'
-            # agent_df_path = f'data/results/MIM/exp_{exp}_b=10/agent_result_{i}.csv'
-
-            # model_df_path = f'data/results/MIM/exp_{exp}_br=0.02/result_{i}.csv'
-
-            # model_df_path = f'data/results/MIM/exp_{exp}_ad={ad}/result_{i}.csv'
-
-            # model_df_path = f"data/results/MIM/exp_{exp}_irate={irate}/result_{i}.csv"
-
-            # model_df_path = f"data/results/MIM/exp_{exp}_irange={irange[0]}-{irange[1]}/result_{i}.csv"
-
-            # model_df_path = f"data/results/MIM/exp_{exp}_w=25/result_{i}.csv"
-            # agent_df_path = f"data/results/MIM/exp_{exp}_w=25/agent_result_{i}.csv"
-
-            if exists(model_df_path):
-                print(f"{model_df_path} exists, passing")
-                continue
-
-            if exists(agent_df_path):
-                print(f"{agent_df_path} exists, passing")
-                continue
-
-            # Initialise the agents based on the agent_parameters
-            social_model = SocialModel(
-                G,
-                seed=i,
-                exp=exp,
-                flooding_capacity=25,
-                bot_follower_percentage=bfp,
-                activation_delay=0,
-                inoculation_rate=0.2,
-                inoculation_range=[0.2, 0.8],
-                from_scratch=True,
-                param_index=i,
-                collect_agent_data=True,
-            )
-
-            for step in trange(config.simulation_periods):
-                social_model.step()
-
-            model_df = social_model.model_data_collector.get_model_vars_dataframe()
-            model_df.to_csv(model_df_path, index=False)
-
-            agent_df = social_model.agent_data_collector.get_agent_vars_dataframe()
-            agent_df.to_csv(agent_df_path, index=False)
-
-        # print(agent_dfs)
+import argparse
+import json
+
+import config
+
+# The simulation modules are imported by the commands which need them, so
+# that the entry point itself starts instantly and each command only pays
+# for its own dependencies (plotting and notebooks ones are never loaded)
+
+
+def parse_param(text):
+    """
+    Parses a key=value SocialModel argument, the value as JSON when it is one
+    (e.g. inoculation_range=[0.2,0.8]) and as a string otherwise
+    """
+    key, _, value = text.partition("=")
+    try:
+        return key, json.loads(value)
+    except json.JSONDecodeError:
+        return key, value
+
+
+def run(args):
+    """
+    Simulates a single run headless and writes its model data as CSV
+    """
+    from social_model import SocialModel
+    from utils import load_graph
+
+    params = {**config.sweep_defaults, "exp": args.exp, "engine": args.engine}
+    params["bot_follower_percentage"] = config.bot_follower_percentage[0]
+    params.update(parse_param(param) for param in args.param)
+
+    G = load_graph(args.network, sep=",", whole=True, as_networkx=False)
+    social_model = SocialModel(
+        G,
+        seed=args.seed,
+        from_scratch=True,
+        param_index=args.seed,
+        collect_agent_data=False,
+        **params,
+    )
+    while social_model.schedule.steps < args.steps and not social_model.converged:
+        social_model.step()
+
+    model_df = social_model.get_model_vars_dataframe()
+    if args.output:
+        model_df.to_csv(args.output)
+    else:
+        print(model_df.tail().to_string())
+
+
+def sweep(args):
+    """
+    Runs the sweep of config.sweep_grid, see sweep.run_sweep
+    """
+    from sweep import run_sweep
+
+    run_sweep(
+        results_path=args.results_path,
+        network_path=args.network,
+        workers=args.workers,
+        branching=args.branching,
+    )
+
+
+def startup(args):
+    """
+    Reports the import time of the modules a sweep worker loads, in a fresh
+    interpreter, and the heavy dependencies they pull in
+    """
+    from benchmark import bench_startup
+
+    for result in bench_startup(args.modules, repeat=args.repeat):
+        print(json.dumps(result))
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Simulate misinformation interventions")
+    commands = parser.add_subparsers(dest="command")
+
+    run_parser = commands.add_parser("run", help="simulate a single run")
+    run_parser.add_argument("--exp", type=int, default=1)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--steps", type=int, default=config.simulation_periods)
+    run_parser.add_argument("--engine", choices=["object", "vector"], default=config.engine)
+    run_parser.add_argument("--network", default=config.network_path)
+    run_parser.add_argument(
+        "--param", action="append", default=[], metavar="KEY=VALUE",
+        help="SocialModel argument overriding config.sweep_defaults",
+    )
+    run_parser.add_argument("--output", help="CSV file to write, a summary on stdout if omitted")
+    run_parser.set_defaults(handler=run)
+
+    sweep_parser = commands.add_parser("sweep", help="run the sweep of config.sweep_grid")
+    sweep_parser.add_argument("--workers", type=int)
+    sweep_parser.add_argument(
+        "--no-branching", dest="branching", action="store_false", default=None
+    )
+    sweep_parser.add_argument("--results-path")
+    sweep_parser.add_argument("--network")
+    sweep_parser.set_defaults(handler=sweep)
+
+    startup_parser = commands.add_parser(
+        "startup", help="measure the import time of the simulation modules"
+    )
+    startup_parser.add_argument("--modules", nargs="+", default=["sweep"])
+    startup_parser.add_argument("--repeat", type=int, default=5)
+    startup_parser.set_defaults(handler=startup)
+    return parser
+
+
+# The experiments and parameters to sweep over are specified by
+# config.sweep_grid and config.sweep_defaults, each combination is run
+# config.simulation_number times on a pool of worker processes, which is
+# also what running this file without a command does
+if __name__ == "__main__":
+    args = get_parser().parse_args()
+    if args.command is None:
+        args = get_parser().parse_args(["sweep"])
+    args.handler(args)
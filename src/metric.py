@@ -1,114 +1,103 @@
-import math
-from statistics import mean
-
 import numpy as np
 
 import config
 from agent_type import AgentType
-from utils import get_intervals
 
 
 class Metric:
-    def misinformation(model):
-        misinfo = mean(
-            [(a.calculate_opinion() - config.truth) ** 2 for a in model.get_agents()]
-        )
+    """
+    Each metric is computed from an opinion snapshot of all agents (and their
+    AgentTypes where needed), see Metric.collect for taking them all at once
+    """
+
+    def collect(opinions, agent_types):
+        """
+        Derives every opinion-based model metric from a single snapshot
+
+        Args:
+            opinions (np.ndarray): opinion of every agent
+            agent_types (np.ndarray): AgentType of every agent, aligned with opinions
+
+        Returns:
+            dict: metric name -> value
+        """
+        return {
+            "polarization": Metric.polarization(opinions),
+            "misinformation": Metric.misinformation(opinions),
+            "average_opinion_all": Metric.average_opinion_all(opinions),
+            "average_opinion_left": Metric.average_opinion_left(opinions, agent_types),
+            "average_opinion_right": Metric.average_opinion_right(
+                opinions, agent_types
+            ),
+            "average_opinion_reg": Metric.average_opinion_reg(opinions, agent_types),
+        }
+
+    def misinformation(opinions):
+        misinfo = np.mean((opinions - config.truth) ** 2)
         return misinfo
 
     # todo: change this to the definition of the paper
 
-    def polarization(model):
+    def polarization(opinions):
         """
         Original definition from Esteban94
         """
 
         # Initialise 7 groups
         alpha = 0.5
-        groups = [np.array([]) for _ in range(config.belief_distribution_groups)]
-
-        # Distribute all agents into the corresponding group based on their opinion
-        opinions = [a.calculate_opinion() for a in model.get_agents()]
-
-        lower = min(opinions)
-        upper = max(opinions)
+        num_groups = config.belief_distribution_groups
+        num_agents = len(opinions)
 
-        opinion_intervals = get_intervals(lower, upper, len(groups))
+        # Distribute all agents into the corresponding group based on their opinion,
+        # the intervals are closed and an opinion on a shared edge goes to the lower one
+        end_points = np.linspace(opinions.min(), opinions.max(), num_groups + 1)
+        group_ids = np.searchsorted(end_points[1:], opinions, side="left")
 
-        for op in opinions:
-            for i, interval in enumerate(opinion_intervals):
-                low, high = interval
-                if low <= op <= high:
-                    groups[i] = np.append(groups[i], op)
-                    break
+        group_sizes = np.bincount(group_ids, minlength=num_groups)
+        group_sums = np.bincount(group_ids, weights=opinions, minlength=num_groups)
 
-        group_wise_pols = []
+        ratios = group_sizes / num_agents
+        # Empty groups have a nan average, their terms are counted as 0 below
+        with np.errstate(divide="ignore", invalid="ignore"):
+            average_opinions = group_sums / group_sizes
 
-        # Implement the formula
-        for i in range(config.belief_distribution_groups):
-            for j in range(config.belief_distribution_groups):
-                i_ratio = len(groups[i]) / model.schedule.get_agent_count()
-
-                j_ratio = len(groups[j]) / model.schedule.get_agent_count()
-                i_average_opinion = np.average(groups[i])
-                j_average_opinion = np.average(groups[j])
-
-                """
-                from azzimonti2022social:
-                "The mutiplication by 2 is a normalization such that Pol = 1
-                when a=0, two groups equally sized, group opinions are 0 and 1."
-                """
-                K = 1 / (2 * (0.5) ** (2 + alpha))
-
-                group_wise_pol = (
-                    K
-                    * i_ratio ** (1 + alpha)
-                    * j_ratio
-                    * abs(i_average_opinion - j_average_opinion)
-                )
-
-                group_wise_pols.extend([group_wise_pol])
+        """
+        from azzimonti2022social:
+        "The mutiplication by 2 is a normalization such that Pol = 1
+        when a=0, two groups equally sized, group opinions are 0 and 1."
+        """
+        K = 1 / (2 * (0.5) ** (2 + alpha))
+
+        # Implement the formula for every (i, j) pair of groups at once
+        group_wise_pols = (
+            K
+            * ratios[:, None] ** (1 + alpha)
+            * ratios[None, :]
+            * np.abs(average_opinions[:, None] - average_opinions[None, :])
+        )
 
-        polarization = sum([0 if math.isnan(pol) else pol for pol in group_wise_pols])
+        polarization = float(np.nansum(group_wise_pols))
         return polarization
 
-    def average_opinion_all(model):
-        average_opinion = mean([a.calculate_opinion() for a in model.get_agents()])
+    def average_opinion_all(opinions):
+        average_opinion = np.mean(opinions)
         return average_opinion
 
-    def average_opinion_left(model):
-        try:
-            average_opinion = mean(
-                [
-                    a.calculate_opinion()
-                    for a in model.get_agents()
-                    if a.agent_type == AgentType.LBF
-                ]
-            )
-        except:
-            average_opinion = 0
+    def average_opinion_left(opinions, agent_types):
+        opinions = opinions[agent_types == AgentType.LBF]
+        average_opinion = np.mean(opinions) if len(opinions) else 0
 
         return average_opinion
 
-    def average_opinion_right(model):
-        try:
-            average_opinion = mean(
-                [
-                    a.calculate_opinion()
-                    for a in model.get_agents()
-                    if a.agent_type == AgentType.RBF
-                ]
-            )
-        except:
-            average_opinion = 0
+    def average_opinion_right(opinions, agent_types):
+        opinions = opinions[agent_types == AgentType.RBF]
+        average_opinion = np.mean(opinions) if len(opinions) else 0
 
         return average_opinion
 
-    def average_opinion_reg(model):
-        average_opinion = mean(
-            [
-                a.calculate_opinion()
-                for a in model.get_agents()
-                if a.agent_type == AgentType.R or a.agent_type == AgentType.RA
-            ]
-        )
+    def average_opinion_reg(opinions, agent_types):
+        opinions = opinions[
+            (agent_types == AgentType.R) | (agent_types == AgentType.RA)
+        ]
+        average_opinion = np.mean(opinions)
         return average_opinion
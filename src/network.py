@@ -1,50 +1,60 @@
 import math
 import random
-from itertools import combinations
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from operator import itemgetter
-from statistics import mean
+from statistics import NormalDist, mean
 
-import matplotlib.pyplot as plt
 import networkx as nx
 import numpy as np
 import pandas as pd
-from ipysigma import Sigma
-from tqdm import tqdm, trange
 
 import config
+from csr_graph import CSRGraph
 from utils import coin_flip
 
 
-def find_matching_pair(G: nx.Graph, nodes, v):
-    # Find all x,w pairs which are alters(neighbors) of v, and not connected to each other
-    neighbors_of_v = list(nx.all_neighbors(G, v))
-    xw_pairs = [(x, w) for (x, w) in combinations(
-        neighbors_of_v, 2) if G.has_edge(x, w) == False]
-
-    # Find all y,z pairs which are not alters of v, and not connected to each other
-    # also they can not be connected to v
-    not_neighbors_of_v = list(set(nodes) - set(neighbors_of_v))
-    yz_pairs = [(y, z) for (y, z) in combinations(
-        not_neighbors_of_v, 2) if G.has_edge(y, z) == False]
-
-    # Find a random matching so that one node in xw pair connects to yz in another pair
-    matching_pair = []
-
-    for xw_pair in xw_pairs:
-        for yz_pair in yz_pairs:
-            x, w = xw_pair
-            y, z = yz_pair
-            # find all matching pairs such that there each node
-            # in one pair is connected to at least one node in the other pair
-            if G.has_edge(x, z) & G.has_edge(w, y) | G.has_edge(x, y) & G.has_edge(w, z):
-                matching_pair = [x, w, y, z]
-                break
-            else:
-                continue
-    return matching_pair
-
-
-def pick_five_nodes(G: nx.Graph):
+def find_matching_pair(G: nx.Graph, v, max_tries=20):
+    '''
+    Samples x,w pairs among the alters of v and, for each one, y,z pairs
+    among the neighbors of w and x outside v's alters, stopping at the first
+    configuration meeting the conditions of pick_five_nodes
+
+    Args:
+        max_tries (int): number of x,w pairs sampled before giving up
+
+    Returns:
+        list: [x, w, y, z] with ewy and exz, None if no configuration was found
+    '''
+    neighbors_of_v = set(nx.all_neighbors(G, v))
+    if len(neighbors_of_v) < 2:
+        return None
+    candidates = list(neighbors_of_v)
+    excluded = neighbors_of_v | {v}
+
+    for _ in range(max_tries):
+        # x and w are alters of v, not connected to each other
+        x, w = random.sample(candidates, 2)
+        if G.has_edge(x, w):
+            continue
+
+        # y is connected from w and z from x, neither of them is v or an alter of v
+        ys = [y for y in G[w] if y not in excluded]
+        zs = [z for z in G[x] if z not in excluded]
+        if not ys or not zs:
+            continue
+
+        for _ in range(max_tries):
+            y = random.choice(ys)
+            z = random.choice(zs)
+            # y and z must not be connected to each other
+            if y != z and not G.has_edge(y, z):
+                return [x, w, y, z]
+
+    return None
+
+
+def pick_five_nodes(G: nx.Graph, nodes=None, max_tries=10000):
     '''
     'five nodes in the random graph are randomly selected ...'
 
@@ -54,50 +64,101 @@ def pick_five_nodes(G: nx.Graph):
     2) y and z are not alters of v;
     3) ewy and exz do exist.
     4) ewx and eyz do NOT exist.'
-    '''
 
-    # first pick v randomly, with at least 2 neighbors
-    nodes = list(G.nodes())
+    Args:
+        nodes (list): the nodes of G, pass them when picking repeatedly from
+            the same graph to avoid listing them on every call
+        max_tries (int): number of v sampled before giving up
 
-    nodes_with_two_neighbors = [n for n in nodes if len(
-        list(nx.all_neighbors(G, n))) >= 2]
+    Returns:
+        tuple: x, w, y, z, v, None if no configuration was found
+    '''
+    nodes = list(G.nodes()) if nodes is None else nodes
 
-    random.shuffle(nodes_with_two_neighbors)
+    for _ in range(max_tries):
+        # pick v randomly, with at least 2 neighbors
+        v = random.choice(nodes)
+        if G.degree(v) < 2:
+            continue
 
-    while True:
-        try:
-            v = nodes_with_two_neighbors.pop()
-            matching_pair = find_matching_pair(G, nodes, v)
-            x, w, y, z = matching_pair
-            break
-        except ValueError:
+        matching_pair = find_matching_pair(G, v)
+        if matching_pair is None:
             continue
+        x, w, y, z = matching_pair
 
-    # check algo validity
+        # check algo validity
 
-    # assert ego_network.has_edge(v, x)
-    # assert ego_network.has_edge(v, w)
-    # assert ego_network.has_edge(v, y) == False
-    # assert ego_network.has_edge(v, z) == False
-    # assert ego_network.has_edge(x, z)
-    # assert ego_network.has_edge(y, w)
+        # assert ego_network.has_edge(v, x)
+        # assert ego_network.has_edge(v, w)
+        # assert ego_network.has_edge(v, y) == False
+        # assert ego_network.has_edge(v, z) == False
+        # assert ego_network.has_edge(x, z)
+        # assert ego_network.has_edge(y, w)
 
-    return x, w, y, z, v
+        return x, w, y, z, v
 
+    return None
+
+
+class TransitivityCounter:
+    '''
+    Keeps the triangle and connected triple counts of an undirected graph
+    up to date edge by edge, so that its transitivity (as nx.transitivity,
+    3 * triangles / triples) does not need a full triangle count after
+    every rewiring.
 
-def rewire_edges(G: nx.Graph, x, w, y, z):
+    Edges must be removed/added through the counter for the counts to stay valid
+    '''
+
+    def __init__(self, G: nx.Graph):
+        self.G = G
+        self.triangles = sum(nx.triangles(G).values()) // 3
+        self.triples = sum(d * (d - 1) // 2 for d in self.degrees(G.nodes()))
+
+    def degrees(self, nodes):
+        return (len(self.G[n]) - (n in self.G[n]) for n in nodes)
+
+    def common_neighbors(self, u, v):
+        return len((self.G[u].keys() & self.G[v].keys()) - {u, v})
+
+    def remove_edge(self, u, v):
+        if not self.G.has_edge(u, v):
+            return
+        du, dv = self.degrees((u, v))
+        # Every triangle over (u, v) and every triple centred on u or v using it is lost
+        self.triangles -= self.common_neighbors(u, v)
+        self.triples -= (du - 1) + (dv - 1)
+        self.G.remove_edge(u, v)
+
+    def add_edge(self, u, v):
+        if self.G.has_edge(u, v):
+            return
+        du, dv = self.degrees((u, v))
+        self.triangles += self.common_neighbors(u, v)
+        self.triples += du + dv
+        self.G.add_edge(u, v)
+
+    def transitivity(self):
+        return 3 * self.triangles / self.triples if self.triples else 0
+
+
+def rewire_edges(G: nx.Graph, x, w, y, z, counter: TransitivityCounter = None):
     '''
     '...two edges among them are partly rewired to add one triangle'
+
+    The edges are changed through counter when one is given, keeping its counts valid
     '''
+    graph = G if counter is None else counter
+
     if G.has_edge(x, y) & G.has_edge(w, z):
-        G.remove_edge(x, y)
-        G.remove_edge(w, z)
+        graph.remove_edge(x, y)
+        graph.remove_edge(w, z)
     elif G.has_edge(x, z) & G.has_edge(w, y):
-        G.remove_edge(x, z)
-        G.remove_edge(w, y)
+        graph.remove_edge(x, z)
+        graph.remove_edge(w, y)
 
-    G.add_edge(x, w)
-    G.add_edge(y, z)
+    graph.add_edge(x, w)
+    graph.add_edge(y, z)
 
 
 # Algorithm for increasing the clustering coefficient of a graph (Guo and Kraines, 2009)
@@ -110,19 +171,25 @@ def increase_clustering_coefficient(G: nx.Graph, tcc):
         cc(float): target clustering coefficient
     '''
 
-    acc = nx.transitivity(G)
+    # Triangles and triples are only updated around the rewired edges
+    counter = TransitivityCounter(G)
+    acc = counter.transitivity()
 
     '''
     the process will be repeated until the average clustering coefficient
     of the rewired graph is greater than or equal to the target average clustering coefficient C(G)
     '''
 
+    nodes = list(G.nodes())
     while acc < tcc:
-        # Recalculate every loop
-        acc = nx.transitivity(G)
         # pick five node comforming to the 5 conditions
-        x, w, y, z, v = pick_five_nodes(G)
-        rewire_edges(G, x, w, y, z)
+        five_nodes = pick_five_nodes(G, nodes)
+        if five_nodes is None:
+            print(f'No configuration left to rewire, stopping at acc: {acc}')
+            break
+        x, w, y, z, v = five_nodes
+        rewire_edges(G, x, w, y, z, counter)
+        acc = counter.transitivity()
         print(f'acc: {acc}')
 
 # Taken from https://stackoverflow.com/a/64787324
@@ -230,7 +297,76 @@ def generate_ego_network(n: int, m: float, p: float, seed: int):
     return graph
 
 
-def compute_average_path_length(G: nx.Graph):
+# Graph of the running estimate_average_path_length, set in every worker of its process pool
+_path_length_csr = None
+
+
+def _set_path_length_csr(csr):
+    global _path_length_csr
+    _path_length_csr = csr
+
+
+def _mean_distance_from(source, csr=None):
+    csr = _path_length_csr if csr is None else csr
+    distances = csr.bfs(source)
+    reached = distances > 0
+    return distances[reached].mean() if reached.any() else 0.0
+
+
+def estimate_average_path_length(G, num_sources=100, workers=1, processes=False,
+                                 confidence=0.95, seed=None):
+    '''
+    Estimates the average shortest path length of a connected (strongly
+    connected if directed) graph with single-source BFS from a random sample
+    of sources, each traversal giving the distances to every target
+
+    Args:
+        G (nx.Graph | CSRGraph)
+        num_sources (int): number of sources sampled without replacement,
+            the estimate is exact when it is at least the number of nodes
+        workers (int): number of threads the sources are spread over
+        processes (bool): spread the sources over processes instead of threads
+        confidence (float): level of the confidence interval
+        seed (int): seed of the source sample
+
+    Returns:
+        dict: mean, ci_low, ci_high and num_sources of the estimate
+    '''
+    csr = G if isinstance(G, CSRGraph) else CSRGraph.from_networkx(G, relabel=True)
+    n = csr.number_of_nodes()
+    sources = np.random.default_rng(seed).choice(n, size=min(num_sources, n), replace=False)
+
+    if workers > 1 and processes:
+        with ProcessPoolExecutor(workers, initializer=_set_path_length_csr, initargs=(csr,)) as executor:
+            chunksize = max(1, len(sources) // (4 * workers))
+            means = list(executor.map(_mean_distance_from, sources, chunksize=chunksize))
+    elif workers > 1:
+        with ThreadPoolExecutor(workers) as executor:
+            means = list(executor.map(partial(_mean_distance_from, csr=csr), sources))
+    else:
+        means = [_mean_distance_from(source, csr) for source in sources]
+    means = np.array(means)
+    average = float(means.mean())
+
+    # Normal interval over the per-source means, with the finite population
+    # correction since the sources are drawn without replacement
+    if len(means) == n:
+        half_width = 0.0
+    elif len(means) > 1:
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        correction = (n - len(means)) / (n - 1)
+        half_width = z * means.std(ddof=1) * math.sqrt(correction / len(means))
+    else:
+        half_width = math.nan
+
+    return {'mean': average,
+            'ci_low': average - half_width,
+            'ci_high': average + half_width,
+            'num_sources': len(means),
+            }
+
+
+def compute_average_path_length(G: nx.Graph, num_sources=100, workers=1):
     component_lengths = []
 
     if G.is_directed():
@@ -242,27 +378,39 @@ def compute_average_path_length(G: nx.Graph):
     for component in components:
 
         component = G.subgraph(component)
-        nodes = component.nodes()
-        lengths = []
-
-        for _ in range(10000):
-            n1, n2 = random.choices(list(nodes), k=2)
-            length = nx.shortest_path_length(
-                component, source=n1, target=n2)
-            lengths.append(length)
+        estimate = estimate_average_path_length(component, num_sources, workers)
 
         # Collect component-level avearge lengths for computing graph-level average
-        component_lengths.append(mean(lengths))
+        component_lengths.append(estimate['mean'])
 
     return mean(component_lengths)
 
 
-def get_network_stats(G: nx.Graph, show_graph=False):
+def get_network_stats(G: nx.Graph, show_graph=False, approximate=False,
+                      num_sources=100, workers=1):
+    '''
+    Args:
+        approximate (bool): estimate the average path length of the largest
+            (strongly) connected component with estimate_average_path_length
+            instead of computing it exactly over all pairs
+        num_sources (int), workers (int): see estimate_average_path_length
+    '''
     reciprocity = nx.overall_reciprocity(G)
     average_degree = sum(
         [y for (x, y) in G.degree]) / G.number_of_nodes()
     average_in_degree = None
-    average_path_length = nx.average_shortest_path_length(G)
+    average_path_length_ci = None
+    if approximate:
+        if G.is_directed():
+            largest_component = max(nx.strongly_connected_components(G), key=len)
+        else:
+            largest_component = max(nx.connected_components(G), key=len)
+        estimate = estimate_average_path_length(
+            G.subgraph(largest_component), num_sources, workers)
+        average_path_length = estimate['mean']
+        average_path_length_ci = (estimate['ci_low'], estimate['ci_high'])
+    else:
+        average_path_length = nx.average_shortest_path_length(G)
     if G.is_directed():
 
         if not nx.is_strongly_connected(G):
@@ -285,9 +433,11 @@ def get_network_stats(G: nx.Graph, show_graph=False):
                  'average_degree': average_degree,
                  'diameter': diameter,
                  'average_path_length': average_path_length,
+                 'average_path_length_ci': average_path_length_ci,
                  'average_in_degree': average_in_degree,
                  }
 
     if show_graph:
+        # nx.draw only imports matplotlib when a graph is actually drawn
         nx.draw(G,  node_color='black', node_size=0.1, with_labels=False)
     return stat_info
@@ -0,0 +1,132 @@
+import cProfile
+import functools
+import json
+import pstats
+import time
+from contextlib import nullcontext
+
+import pandas as pd
+
+# Returned by disabled timers so that instrumented code only pays for a method call
+_NULL_PHASE = nullcontext()
+
+
+class _Phase:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.timer.stack.append(self)
+        self.child_seconds = 0.0
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        stack = self.timer.stack
+        stack.pop()
+        if stack:
+            stack[-1].child_seconds += elapsed
+
+        totals = self.timer.phases.get(self.name)
+        if totals is None:
+            totals = self.timer.phases[self.name] = [0, 0.0, 0.0]
+        totals[0] += 1
+        totals[1] += elapsed
+        totals[2] += elapsed - self.child_seconds
+
+
+class PhaseTimer:
+    """
+    Opt-in wall-time and call count accounting of the phases of a step.
+
+    Code is instrumented with
+
+        with timer.phase("belief_update"):
+            ...
+
+    Code which runs too often for even a disabled phase to be free, like the
+    per-agent methods, is instead wrapped with instrument, only when enabled.
+
+    Phases may nest, each one keeps its total time and its self time (total
+    minus the phases nested in it), e.g. the self time of "schedule" is what
+    the scheduler spends shuffling and dispatching the agents.
+
+    profile_steps optionally runs cProfile over the steps in [start, stop)
+    """
+
+    def __init__(self, enabled=False, profile_steps=None):
+        self.enabled = enabled
+        self.phases = {}
+        self.stack = []
+
+        self.profile_steps = profile_steps
+        self.profiler = cProfile.Profile() if profile_steps is not None else None
+
+    def phase(self, name):
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def instrument(self, obj, method_name, name=None):
+        """
+        Times every call of obj.method_name as the phase name (method_name by
+        default) by shadowing the method on the instance
+        """
+        method = getattr(obj, method_name)
+
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            with _Phase(self, name or method_name):
+                return method(*args, **kwargs)
+
+        setattr(obj, method_name, timed)
+
+    def start_step(self, step):
+        if self.profiler is not None and self.is_profiled(step):
+            self.profiler.enable()
+
+    def end_step(self, step):
+        if self.profiler is not None and self.is_profiled(step):
+            self.profiler.disable()
+
+    def is_profiled(self, step):
+        start, stop = self.profile_steps
+        return start <= step < stop
+
+    def report(self):
+        """
+        Returns:
+            dict: phase -> calls, seconds (total) and self_seconds
+        """
+        return {
+            name: {"calls": calls, "seconds": seconds, "self_seconds": self_seconds}
+            for name, (calls, seconds, self_seconds) in self.phases.items()
+        }
+
+    def to_dataframe(self):
+        """
+        Returns:
+            pd.DataFrame: one row per phase, sorted by self time, with its
+                share of the total instrumented time
+        """
+        df = pd.DataFrame.from_dict(self.report(), orient="index")
+        if df.empty:
+            return df
+        df["self_share"] = df["self_seconds"] / df["self_seconds"].sum()
+        return df.sort_values("self_seconds", ascending=False)
+
+    def save(self, path):
+        with open(path, "w") as fp:
+            json.dump(self.report(), fp, indent=2)
+
+    def get_profile_stats(self):
+        """
+        Returns:
+            pstats.Stats: cProfile statistics of the profiled steps, None if
+                no step range was profiled
+        """
+        if self.profiler is None:
+            return None
+        return pstats.Stats(self.profiler)
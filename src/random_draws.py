@@ -0,0 +1,37 @@
+import numpy as np
+
+import config
+
+
+class StepDraws:
+    """
+    All the Bernoulli draws one step of the model consumes, made in bulk at
+    the start of the step instead of one numpy call per coin flip:
+
+    - edge_attention[k]: whether the source of CSR edge k pays attention to
+      its neighbor (the coin_flip in SocialAgent.get_neighbors)
+    - truth_signal[i]: whether agent i receives a signal from the unbiased
+      source (SocialAgent.learn_truth)
+    - bot_attention[i]: whether bot follower i listens to its bots
+      (BotFollower.get_neighbors), indexed by unique_id like truth_signal
+
+    Seeding the generator makes the whole stream reproducible.
+    """
+
+    def __init__(self, seed, num_edges, num_agents):
+        self.rng = np.random.default_rng(seed)
+        self.num_edges = num_edges
+        self.num_agents = num_agents
+
+        self.edge_attention = np.zeros(num_edges, dtype=bool)
+        self.truth_signal = np.zeros(num_agents, dtype=bool)
+        self.bot_attention = np.zeros(num_agents, dtype=bool)
+
+    def draw(self):
+        self.edge_attention = (
+            self.rng.random(self.num_edges) < config.communication_speed
+        )
+        self.truth_signal = self.rng.random(self.num_agents) < 0.5
+        self.bot_attention = (
+            self.rng.random(self.num_agents) < config.communication_speed
+        )
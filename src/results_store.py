@@ -0,0 +1,213 @@
+import os
+from glob import glob
+
+import pandas as pd
+
+from aggregate import RunningAggregate
+
+# Short names of the SocialModel parameters, used for the partitions of the
+# store and the result folder names, e.g. exp_3_bfp=0.3
+PARAMETER_TAGS = {
+    "flooding_capacity": "w",
+    "bot_follower_percentage": "bfp",
+    "activation_delay": "ad",
+    "inoculation_rate": "irate",
+    "inoculation_range": "irange",
+}
+
+# cfg is the run variant, a hash of the run's other arguments, the config and
+# the network (see run_cache.get_run_variant)
+PARTITION_KEYS = ["exp"] + list(PARAMETER_TAGS.values()) + ["cfg"]
+
+
+def format_parameter(value):
+    if isinstance(value, (list, tuple)):
+        return "-".join(str(v) for v in value)
+    return str(value)
+
+
+def parse_run_name(name):
+    """
+    Args:
+        name (str): e.g. 3_bfp=0.3, as passed to get_MIM_df
+
+    Returns:
+        dict: partition filters, e.g. {"exp": "3", "bfp": "0.3"}
+    """
+    exp, *tags = str(name).split("_")
+    filters = {"exp": exp}
+    for tag in tags:
+        key, value = tag.split("=", 1)
+        filters[key] = value
+    return filters
+
+
+class ResultsStore:
+    """
+    Model and agent series of every run stored as zstd-compressed Parquet,
+    partitioned hive-style by the run's parameters, variant and seed, e.g.
+
+        root/exp=3/w=25/bfp=0.3/ad=0/irate=0.2/irange=0.2-0.8/cfg=1f0c.../seed=0/model.parquet
+
+    so that reads only open the partitions matching a filter and only decode
+    the requested columns. Next to the seeds, each parameter combination
+    keeps a RunningAggregate of its model series in aggregate.npz.
+
+    The variant tells apart the runs of the same parameters made with
+    another engine, config or network, which therefore never overwrite each
+    other's results nor share an aggregate.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def get_params_path(self, params, variant):
+        partitions = {"exp": params["exp"]}
+        for key, tag in PARAMETER_TAGS.items():
+            partitions[tag] = params[key]
+        partitions["cfg"] = variant
+
+        parts = [f"{key}={format_parameter(value)}" for key, value in partitions.items()]
+        return os.path.join(self.root, *parts)
+
+    def get_run_path(self, params, variant, seed):
+        return os.path.join(self.get_params_path(params, variant), f"seed={seed}")
+
+    def write_run(self, params, variant, seed, model_df, agent_df=None):
+        """
+        Args:
+            params (dict): SocialModel arguments of the run
+            variant (str): run_cache.get_run_variant of the run
+            seed (int)
+            model_df (pd.DataFrame): get_model_vars_dataframe() of the run
+            agent_df (pd.DataFrame): get_agent_vars_dataframe() of the run
+        """
+        run_path = self.get_run_path(params, variant, seed)
+        os.makedirs(run_path, exist_ok=True)
+
+        write_parquet(model_df, os.path.join(run_path, "model.parquet"))
+        if agent_df is not None:
+            write_parquet(agent_df, os.path.join(run_path, "agent.parquet"))
+
+    def update_aggregate(
+        self, params, variant, seed, model_df, reservoir_size=0, num_steps=None
+    ):
+        """
+        Adds a finished run to the running aggregate of its parameter
+        combination, a run is only ever counted once
+
+        Args:
+            reservoir_size (int): number of runs kept for quantiles when the
+                aggregate is created
+            num_steps (int): length every run is padded to (see pad_model_df),
+                so that runs which stopped early at different steps line up
+        """
+        if num_steps is not None:
+            model_df = pad_model_df(model_df, num_steps)
+
+        path = os.path.join(self.get_params_path(params, variant), "aggregate.npz")
+        if os.path.exists(path):
+            aggregate = RunningAggregate.load(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            aggregate = RunningAggregate(model_df.columns, len(model_df), reservoir_size)
+
+        aggregate.update(model_df, seed)
+        aggregate.save(path)
+        return aggregate
+
+    def read_aggregate(self, **filters):
+        """
+        Returns:
+            RunningAggregate: the aggregate of the parameter combination
+                matching the filters, None if there is none
+
+        Raises:
+            ValueError: if the filters match more than one parameter combination
+        """
+        if "seed" in filters or set(filters) - set(PARTITION_KEYS):
+            return None
+
+        parts = [
+            f"{key}={format_parameter(filters[key])}" if key in filters else f"{key}=*"
+            for key in PARTITION_KEYS
+        ]
+        paths = sorted(glob(os.path.join(self.root, *parts, "aggregate.npz")))
+        check_single_combination([os.path.dirname(path) for path in paths], filters)
+        return RunningAggregate.load(paths[0]) if paths else None
+
+    def find_runs(self, kind="model", **filters):
+        """
+        Args:
+            kind (str): "model" or "agent"
+            filters: partition values to match, e.g. exp=3, bfp=0.3, seed=0,
+                partitions which are not given match any value, as long as
+                the runs found share one parameter combination
+
+        Returns:
+            list[str]: paths of the matching files
+
+        Raises:
+            ValueError: if the filters match more than one parameter combination
+        """
+        unknown = set(filters) - set(PARTITION_KEYS) - {"seed"}
+        if unknown:
+            return []
+
+        parts = [
+            f"{key}={format_parameter(filters[key])}" if key in filters else f"{key}=*"
+            for key in PARTITION_KEYS + ["seed"]
+        ]
+        paths = sorted(glob(os.path.join(self.root, *parts, f"{kind}.parquet")))
+        # The combination of a run is the path above its seed partition
+        check_single_combination(
+            [os.path.dirname(os.path.dirname(path)) for path in paths], filters
+        )
+        return paths
+
+    def read_runs(self, kind="model", columns=None, **filters):
+        """
+        Returns:
+            list[pd.DataFrame]: one frame per matching run, restricted to columns
+        """
+        return [
+            pd.read_parquet(path, columns=columns)
+            for path in self.find_runs(kind, **filters)
+        ]
+
+
+def pad_model_df(model_df, num_steps):
+    """
+    Pads the model series of a run which stopped early to num_steps by
+    repeating its last row (the per-step ban count is padded with 0)
+    """
+    if len(model_df) >= num_steps or len(model_df) == 0:
+        return model_df
+
+    padding = model_df.iloc[[-1] * (num_steps - len(model_df))]
+    padding = padding.assign(accounts_banned=0)
+    return pd.concat([model_df, padding], ignore_index=True)
+
+
+def check_single_combination(params_paths, filters):
+    """
+    Guards the reads against silently averaging the runs of different
+    parameter combinations when the filters leave some partitions out
+
+    Args:
+        params_paths (list[str]): parameter combination path of every match
+    """
+    combinations = sorted(set(params_paths))
+    if len(combinations) > 1:
+        raise ValueError(
+            f"{filters} matches {len(combinations)} parameter combinations, "
+            f"filter on the partitions which tell them apart:\n"
+            + "\n".join(combinations)
+        )
+
+
+def write_parquet(df, path):
+    # Write next to the target first so an interrupted run never leaves a partial file
+    temp_path = f"{path}.tmp"
+    df.to_parquet(temp_path, compression="zstd", index=False)
+    os.replace(temp_path, path)
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+
+import config
+from results_store import PARAMETER_TAGS
+
+# Hex digits of get_run_variant kept in the store partitions
+VARIANT_LENGTH = 12
+
+# SocialModel arguments which follow the seed (the agent parameter file index)
+SEED_PARAMS = ("param_index",)
+
+# config values the simulation reads, a run depends on them as much as on
+# the SocialModel arguments
+RUN_CONFIG = (
+    "truth",
+    "communication_speed",
+    "opinion_variance",
+    "belief_distribution_groups",
+    "left_bot_number",
+    "right_bot_number",
+    "agent_sleep_count",
+    "not_ban_range",
+    "simulation_periods",
+    "agent_data_stride",
+    "convergence_window",
+    "convergence_tolerances",
+    "convergence_pad",
+)
+
+
+def content_hash(content):
+    # Tuples and lists are the same JSON array, keys are sorted
+    canonical = json.dumps(content, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def get_run_key(model_params, seed, graph_fingerprint):
+    """
+    Args:
+        model_params (dict): every SocialModel argument of the run but the graph
+        seed (int)
+        graph_fingerprint (str): CSRGraph.fingerprint of the network
+
+    Returns:
+        str: sha256 of the canonical JSON of everything the run's results
+            depend on, equal for identical runs and different otherwise
+    """
+    return content_hash(
+        {
+            "params": model_params,
+            "seed": seed,
+            "config": {name: getattr(config, name) for name in RUN_CONFIG},
+            "graph": graph_fingerprint,
+        }
+    )
+
+
+def get_run_variant(model_params, graph_fingerprint):
+    """
+    Args:
+        model_params (dict): every SocialModel argument of the run but the graph
+
+    Returns:
+        str: short hash of everything the run's results depend on besides
+            its exp, tagged parameters (PARAMETER_TAGS) and seed (with
+            SEED_PARAMS), i.e. the cfg partition of the ResultsStore, so
+            that runs with different keys never share a location
+    """
+    untagged = {
+        key: value
+        for key, value in model_params.items()
+        if key != "exp" and key not in PARAMETER_TAGS and key not in SEED_PARAMS
+    }
+    return content_hash(
+        {
+            "params": untagged,
+            "config": {name: getattr(config, name) for name in RUN_CONFIG},
+            "graph": graph_fingerprint,
+        }
+    )[:VARIANT_LENGTH]
+
+
+class RunCache:
+    """
+    Index of the finished runs by run key (get_run_key), appended to
+    root/index.jsonl one entry per run and loaded into a dict for lookups.
+
+    Each entry records where the run's results were written. Every key has
+    its own location (see get_run_variant), an entry whose location was
+    nevertheless rewritten by another key no longer counts as cached.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.index_path = os.path.join(root, "index.jsonl")
+        self.entries = {}
+        # location -> key of the run whose results are currently there
+        self.locations = {}
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as fp:
+                for line in fp:
+                    if line.strip():
+                        self._index(json.loads(line))
+
+    def _index(self, entry):
+        self.entries[entry["key"]] = entry
+        self.locations[entry["path"]] = entry["key"]
+
+    def get(self, key):
+        """
+        Returns:
+            dict: the entry of the run, None if it was never run or its
+                results have since been replaced
+        """
+        entry = self.entries.get(key)
+        if entry is None or self.locations.get(entry["path"]) != key:
+            return None
+        return entry
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def add(self, key, path, **info):
+        """
+        Records a finished run whose results were written to path
+
+        Args:
+            info: anything else worth keeping, e.g. the run id and params
+        """
+        entry = {"key": key, "path": path, **info}
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.index_path, "a") as fp:
+            fp.write(json.dumps(entry) + "\n")
+            fp.flush()
+            os.fsync(fp.fileno())
+        self._index(entry)
+        return entry
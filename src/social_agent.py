@@ -1,15 +1,11 @@
-import math
 import random
 
 import mesa
-import networkx as nx
-from numpy.random import binomial
-from scipy.stats import beta
 
 import config
 from agent_type import AgentType
 from parameter import AgentParameter
-from utils import coin_flip, compute_ab
+from utils import beta_mean, compute_ab
 
 
 class SocialAgent(mesa.Agent):
@@ -33,12 +29,32 @@ class SocialAgent(mesa.Agent):
         self.inoculated = False
         self.inoculation_range = agent_parameter.inoculation_range
 
-    def calculate_opinion(self):
-        opinion = beta.mean(self.a, self.b)
+    @property
+    def a(self):
+        return self._a
+
+    @a.setter
+    def a(self, value):
+        self._a = value
+        self._opinion = None
+
+    @property
+    def b(self):
+        return self._b
 
-        if math.isnan(opinion):
-            opinion = 0
-        return opinion
+    @b.setter
+    def b(self, value):
+        self._b = value
+        self._opinion = None
+
+    def calculate_opinion(self):
+        """
+        The mean of the agent's Beta(a, b) belief, cached until a or b change
+        so that every metric and filter within a step shares one computation
+        """
+        if self._opinion is None:
+            self._opinion = beta_mean(self.a, self.b)
+        return self._opinion
 
     def get_neighbors(self):
         """
@@ -48,10 +64,22 @@ class SocialAgent(mesa.Agent):
 
         # Filtering out neighbors based on result from a bernoulli draw
         # models the fact that a human is not likely to pay attention to every single piece of information
+        # (drawn for every edge at once at the start of the step, see StepDraws)
+        csr = self.model.csr
+        start, stop = csr.indptr[self.unique_id], csr.indptr[self.unique_id + 1]
+        attended = csr.indices[start:stop][
+            self.model.draws.edge_attention[start:stop]
+        ].tolist()
+
+        # Inoculated agents ignore those outside their inoculation range
+        if self.inoculated:
+            in_range = self.model.inoculation_index.get_mask(self.unique_id)
+            attended = [n for n in attended if in_range[n]]
+
         neighbors = [
             self.model.get_agent(n)
-            for n in nx.neighbors(self.G, self.unique_id)
-            if coin_flip() and (self.model.get_agent(n).banned is False)
+            for n in attended
+            if self.model.get_agent(n).banned is False
         ]
 
         return neighbors
@@ -61,19 +89,9 @@ class SocialAgent(mesa.Agent):
         The base class provides the update rules for regular agents and bot followers
         The bot class does not share the same update rule (which will override the base method)
         """
+        # get_neighbors already leaves out whom an inoculated agent ignores
         out_neighbors = self.get_neighbors()
 
-        if self.inoculated:
-            out_neighbors = [
-                a
-                for a in out_neighbors
-                if (
-                    self.inoculation_range[0]
-                    < a.calculate_opinion()
-                    < self.inoculation_range[1]
-                )
-            ]
-
         if len(out_neighbors) == 0:
             w = 0
         else:
@@ -87,6 +105,16 @@ class SocialAgent(mesa.Agent):
         self.a = ((1 - w) * (self.a + truth_a)) + (w * as_from_neighbors)
 
         self.b = ((1 - w) * (self.b + truth_b)) + (w * bs_from_neighbors)
+        self.belief_changed()
+
+    def belief_changed(self):
+        """
+        Keeps the model's InoculationIndex current after a or b changed, so
+        that agents updating later in the step filter on the new opinion
+        """
+        index = self.model.inoculation_index
+        if index is not None:
+            index.update(self.unique_id, self.calculate_opinion())
 
     def learn_truth(self):
         """
@@ -99,23 +127,19 @@ class SocialAgent(mesa.Agent):
         More well-educated people have better possible chance of learning the truth
         """
 
-        if binomial(1, 0.5, 1):
+        if self.model.draws.truth_signal[self.unique_id]:
             a, b = compute_ab(config.truth)
             return a, b
         else:
             return 0, 0
 
-    def step(self):
+    def handle_ban(self):
         """
-        "Note that this rule assumes that agents exchange information (i.e.
-         αj,t and βj,t ) before processing new signals si,t+1." (w24462)
+        Evaluate the opinion this agent holds, ban it if it becomes too extreme (only for experiment 2)
 
-         Update agent as follows:
-         1. Exchange information among interested neighbor nodes
-         2. Receive information from unbiased source
+        Returns:
+            bool: whether the ban check applied, in which case the agent does not update this step
         """
-
-        # Evaluate the opinion this agent holds, ban it if it becomes too extreme (only for experiment 2)
         if (
             (self.exp == 2)
             and (self.model.schedule.steps >= (self.model.activation_delay - 1))
@@ -144,7 +168,21 @@ class SocialAgent(mesa.Agent):
                 self.sleep_count = config.agent_sleep_count
                 self.a = a
                 self.b = b
-        else:
+                self.belief_changed()
+            return True
+        return False
+
+    def step(self):
+        """
+        "Note that this rule assumes that agents exchange information (i.e.
+         αj,t and βj,t ) before processing new signals si,t+1." (w24462)
+
+         Update agent as follows:
+         1. Exchange information among interested neighbor nodes
+         2. Receive information from unbiased source
+        """
+
+        if not self.handle_ban():
             self.update_belief()
         """
         Every agent in this model receives info from unbias sources,
@@ -222,8 +260,12 @@ class BotFollower(SocialAgent):
 
         neighbors = super().get_neighbors()
         # The user will pay attention to information spread by bot also by chance
-        if coin_flip():
-            neighbors.extend([self.model.get_agent(b) for b in self.bot_followed])
+        if self.model.draws.bot_attention[self.unique_id]:
+            bots = self.bot_followed
+            if self.inoculated:
+                in_range = self.model.inoculation_index.get_mask(self.unique_id)
+                bots = [b for b in bots if in_range[b]]
+            neighbors.extend([self.model.get_agent(b) for b in bots])
         return neighbors
 
 
@@ -253,6 +295,7 @@ class LeftWingBot(Bot):
         produce fake news compared to the regular slow of informative signals received by agents"
         """
         self.b = self.b + self.flooding_capacity
+        self.belief_changed()
 
 
 class RightWingBot(Bot):
@@ -262,3 +305,4 @@ class RightWingBot(Bot):
 
     def update_belief(self):
         self.a = self.a + self.flooding_capacity
+        self.belief_changed()
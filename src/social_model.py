@@ -1,23 +1,35 @@
+import copy
+import os
+import pickle
 import random
 
 import mesa
-import networkx as nx
 import numpy as np
 from mesa import DataCollector
-from tqdm import tqdm
 
 import config
+from agent_recorder import AgentRecorder
 from agent_type import AgentType
+from convergence import ConvergenceMonitor
+from csr_graph import CSRGraph
 from data import generate_agent_params, read_agent_params
+from inoculation_index import InoculationIndex
 from metric import Metric
 from parameter import AgentParameter
+from phase_timer import PhaseTimer
+from random_draws import StepDraws
+from results_store import pad_model_df
 from social_agent import *
+from vector_engine import VectorEngine
+
+# Agent attributes which change while stepping, saved by SocialModel.get_state
+AGENT_STATE = ("a", "b", "banned", "sleep_count", "inoculated")
 
 
 class SocialModel(mesa.Model):
     def __init__(
         self,
-        G: nx.Graph,
+        G,
         seed,
         exp,
         flooding_capacity,
@@ -28,9 +40,48 @@ class SocialModel(mesa.Model):
         from_scratch,
         param_index,
         collect_agent_data,
+        engine="object",
+        agent_data_stride=None,
+        agent_data_ids=None,
+        agent_data_spill_path=None,
+        timing=False,
+        profile_steps=None,
+        convergence_window=None,
     ):
+        """
+        Args:
+            G (nx.Graph or CSRGraph): the network, a CSRGraph (e.g. attached
+                from shared memory) is used as is without building a copy
+            engine (str): "object" steps every agent through mesa, "vector"
+                steps the whole population at once with a VectorEngine
+            agent_data_stride (int): steps between agent opinion snapshots,
+                config.agent_data_stride by default
+            agent_data_ids (list): unique_ids of the agents to record, all if None
+            agent_data_spill_path (str): directory to stream full blocks of
+                agent snapshots to, kept in memory if None
+            timing (bool): accumulate the wall time of every phase of a step
+                in self.timer, see PhaseTimer.report
+            profile_steps (tuple): run cProfile over the steps in [start, stop)
+            convergence_window (int): stop stepping once the metrics have
+                settled over this many steps (see ConvergenceMonitor),
+                config.convergence_window by default, 0 never stops
+        """
+        if engine not in ("object", "vector"):
+            raise ValueError(f"Unknown engine {engine}")
+
         self.G = G
+        self.csr = G if isinstance(G, CSRGraph) else CSRGraph.from_networkx(G)
         self.exp = exp
+        self.engine = engine
+        self.timer = PhaseTimer(enabled=timing, profile_steps=profile_steps)
+
+        if convergence_window is None:
+            convergence_window = config.convergence_window
+        self.convergence = None
+        if convergence_window:
+            self.convergence = ConvergenceMonitor(
+                convergence_window, config.convergence_tolerances
+            )
 
         self.l_bot_ids = [
             i
@@ -49,25 +100,44 @@ class SocialModel(mesa.Model):
         self.collect_agent_data = collect_agent_data
         # agents_params = agents_params
         self.schedule = mesa.time.RandomActivation(self)
+        # Registry of agents keyed by unique_id, kept in sync with the schedule
+        # so that neighbor lookups do not have to scan every agent
+        self.agent_index = {}
         self.flooding_capacity = flooding_capacity
         self.bot_follower_percentage = bot_follower_percentage
         self.banned_count = 0
         self.activation_delay = activation_delay
         self.inoculation_rate = inoculation_rate
         self.inoculation_range = inoculation_range
+        self.inoculation_index = None
+        self.vector_engine = None
         if from_scratch:
             self.init_agents_from_scratch(seed)
         else:
             self.read_agents_from_file(param_index)
 
+        self.draws = StepDraws(
+            seed, self.csr.number_of_edges(), self.schedule.get_agent_count()
+        )
+
+        if self.engine == "vector":
+            self.vector_engine = VectorEngine(self)
+        else:
+            self.index_inoculation()
+            if self.timer.enabled:
+                for agent in self.get_agents():
+                    self.timer.instrument(agent, "handle_ban", "ban")
+                    self.timer.instrument(agent, "update_belief", "belief_update")
+                    self.timer.instrument(agent, "get_neighbors", "neighbor_sampling")
+
         self.model_data_collector = DataCollector(
             model_reporters={
-                "polarization": lambda m: Metric.polarization(m),
-                "misinformation": lambda m: Metric.misinformation(m),
-                "average_opinion_all": lambda m: Metric.average_opinion_all(m),
-                "average_opinion_left": lambda m: Metric.average_opinion_left(m),
-                "average_opinion_right": lambda m: Metric.average_opinion_right(m),
-                "average_opinion_reg": lambda m: Metric.average_opinion_reg(m),
+                "polarization": lambda m: m.metrics["polarization"],
+                "misinformation": lambda m: m.metrics["misinformation"],
+                "average_opinion_all": lambda m: m.metrics["average_opinion_all"],
+                "average_opinion_left": lambda m: m.metrics["average_opinion_left"],
+                "average_opinion_right": lambda m: m.metrics["average_opinion_right"],
+                "average_opinion_reg": lambda m: m.metrics["average_opinion_reg"],
                 #  'opinion_l_bot': lambda m: m.get_agent(self.l_bot_id).calculate_opinion(),
                 #  'opinion_r_bot': lambda m: m.get_agent(self.r_bot_id).calculate_opinion(),
                 "accounts_banned": lambda m: m.get_banned_count(),
@@ -78,23 +148,57 @@ class SocialModel(mesa.Model):
             }
         )
 
-        self.agent_data_collector = DataCollector(
-            agent_reporters={
-                "step": lambda a: self.schedule.steps,
-                "opinion": lambda a: a.calculate_opinion(),
-                # 'opinion_l_bf': lambda a: a.calculate_opinion() if a.bot_id == self.l_bot_id else None,
-                # 'opinion_r_bf': lambda a: a.calculate_opinion() if a.bot_id == self.r_bot_id else None,
-            }
+        self.agent_data_collector = AgentRecorder(
+            self,
+            stride=agent_data_stride or config.agent_data_stride,
+            agent_ids=agent_data_ids,
+            spill_path=agent_data_spill_path,
         )
 
     def step(self):
-        self.model_data_collector.collect(self)
+        if self.converged:
+            return
+
+        timer = self.timer
+        step = self.schedule.steps
+        timer.start_step(step)
+
+        self.prepare_step()
+        # The state just collected is the last one of a converged run
+        if self.converged:
+            timer.end_step(step)
+            return
+
+        # The self time of "schedule" is the scheduler's shuffling and
+        # dispatching, the agents' own phases are nested in it
+        with timer.phase("schedule"):
+            if self.engine == "vector":
+                self.vector_engine.step()
+            else:
+                self.schedule.step()
+
+        timer.end_step(step)
+
+    def prepare_step(self):
+        """
+        Collects the data of the current state and makes the draws the next
+        update consumes, everything a step does before the agents update
+        """
+        timer = self.timer
+        with timer.phase("model_data"):
+            # One opinion/type snapshot per step, shared by all the model reporters
+            self.metrics = Metric.collect(self.get_opinions(), self.get_agent_types())
+            self.model_data_collector.collect(self)
 
         if self.collect_agent_data:
-            if self.schedule.steps % 100 == 0:
+            with timer.phase("agent_data"):
                 self.agent_data_collector.collect(self)
 
-        self.schedule.step()
+        if self.convergence is not None:
+            self.convergence.update(self.metrics, self.schedule.steps)
+
+        with timer.phase("draws"):
+            self.draws.draw()
 
     def init_agents_from_scratch(self, seed):
         random.seed(seed)
@@ -126,17 +230,17 @@ class SocialModel(mesa.Model):
             a = BotFollower(
                 self.get_id(), self, agents_params.pop(), self.l_bot_ids, "L"
             )
-            self.schedule.add(a)
+            self.add_agent(a)
 
         for _ in range(num_r_followers):
             a = BotFollower(
                 self.get_id(), self, agents_params.pop(), self.r_bot_ids, "R"
             )
-            self.schedule.add(a)
+            self.add_agent(a)
 
         for _ in range(num_regular_agents):
             a = RegularAgent(self.get_id(), self, agents_params.pop())
-            self.schedule.add(a)
+            self.add_agent(a)
 
         if self.exp == 3:
             for a in random.sample(
@@ -147,11 +251,11 @@ class SocialModel(mesa.Model):
 
         for l_bot_id in self.l_bot_ids:
             l_bot = LeftWingBot(l_bot_id, self, agents_params.pop())
-            self.schedule.add(l_bot)
+            self.add_agent(l_bot)
 
         for r_bot_id in self.r_bot_ids:
             r_bot = RightWingBot(r_bot_id, self, agents_params.pop())
-            self.schedule.add(r_bot)
+            self.add_agent(r_bot)
 
     def read_agents_from_file(self, param_index):
         agent_abs, lfs, rfs = read_agent_params(param_index)
@@ -181,29 +285,184 @@ class SocialModel(mesa.Model):
                 a = RegularAgent(i, self, ab)
                 self.num_regular_agents += 1
 
-            self.schedule.add(a)
+            self.add_agent(a)
+
+    def index_inoculation(self):
+        """
+        Builds the InoculationIndex the inoculated agents of the object engine
+        filter their neighbors with, then kept current by
+        SocialAgent.belief_changed as the agents update one after another
+        """
+        agents = sorted(self.get_agents(), key=lambda a: a.unique_id)
+        inoculated = np.array([a.inoculated for a in agents], dtype=bool)
+        if not inoculated.any():
+            self.inoculation_index = None
+            return
+
+        ranges = np.array(
+            [a.inoculation_range if a.inoculated else (0, 0) for a in agents], dtype=float
+        )
+        self.inoculation_index = InoculationIndex(inoculated, ranges[:, 0], ranges[:, 1])
+        self.inoculation_index.track(np.array([a.calculate_opinion() for a in agents]))
 
     def get_agent(self, unique_id):
         """Helper function for retrieving specific agent
 
+        With the vector engine the agent objects are brought up to date with
+        its arrays first (see VectorEngine.sync_agents)
+
         Args:
             unique_id (int)
 
         Returns:
             Agent: agent with that unique_id
         """
-        try:
-            agent = [a for a in self.schedule.agents if a.unique_id == unique_id][0]
-            return agent
-        except:
-            return None
+        if self.vector_engine is not None:
+            self.vector_engine.sync_agents()
+        return self.agent_index.get(unique_id)
+
+    def add_agent(self, agent):
+        """Adds an agent to the schedule and the id registry"""
+        self.schedule.add(agent)
+        self.agent_index[agent.unique_id] = agent
+
+    def remove_agent(self, agent):
+        """Removes an agent from the schedule and the id registry"""
+        self.schedule.remove(agent)
+        del self.agent_index[agent.unique_id]
 
     def get_agents(self):
+        """
+        Returns:
+            list[SocialAgent]: every agent, up to date with the vector
+                engine's arrays when it is the one stepping
+        """
+        if self.vector_engine is not None:
+            self.vector_engine.sync_agents()
         return self.schedule.agents
 
+    def get_opinions(self):
+        """
+        Returns:
+            np.ndarray: every agent's opinion, aligned with get_agent_types
+        """
+        if self.engine == "vector":
+            return self.vector_engine.opinions()
+        return np.array([a.calculate_opinion() for a in self.get_agents()])
+
+    def get_agent_types(self):
+        """
+        Returns:
+            np.ndarray: every agent's AgentType, aligned with get_opinions
+        """
+        if self.engine == "vector":
+            return self.vector_engine.agent_type
+        return np.array([a.agent_type for a in self.get_agents()])
+
     def get_id(self):
         return self.schedule.get_agent_count()
 
+    @property
+    def converged(self):
+        return self.convergence is not None and self.convergence.converged_step is not None
+
+    def get_model_vars_dataframe(self, pad_to=None):
+        """
+        Args:
+            pad_to (int): number of steps to pad a run which stopped early to,
+                by repeating its last row (the per-step ban count is padded
+                with 0)
+
+        Returns:
+            pd.DataFrame: the model series, one row per step
+        """
+        df = self.model_data_collector.get_model_vars_dataframe()
+        if pad_to is None:
+            return df
+        return pad_model_df(df, pad_to)
+
+    def get_state(self):
+        """
+        Returns:
+            dict: everything that changes while stepping (agent beliefs and
+                ban/sleep/inoculation state, scheduler step, random generators
+                and collected data), enough for set_state to continue a model
+                built with the same arguments bit-identically
+        """
+        if self.engine == "vector":
+            agents = {
+                name: getattr(self.vector_engine, name).copy() for name in AGENT_STATE
+            }
+        else:
+            agents = {
+                name: [getattr(a, name) for a in self.get_agents()]
+                for name in AGENT_STATE
+            }
+
+        return {
+            "engine": self.engine,
+            "num_agents": self.schedule.get_agent_count(),
+            "agents": agents,
+            "steps": self.schedule.steps,
+            "time": self.schedule.time,
+            "banned_count": self.banned_count,
+            # The model's random orders the scheduler, the global generators
+            # are used by the agents' ban reset and coin flips
+            "model_random": self.random.getstate(),
+            "global_random": random.getstate(),
+            "numpy_random": np.random.get_state(),
+            "draws_rng": self.draws.rng.bit_generator.state,
+            "model_vars": copy.deepcopy(self.model_data_collector.model_vars),
+            "agent_data": self.agent_data_collector.get_state(),
+            "convergence": None
+            if self.convergence is None
+            else self.convergence.get_state(),
+        }
+
+    def set_state(self, state):
+        if (state["engine"], state["num_agents"]) != (
+            self.engine,
+            self.schedule.get_agent_count(),
+        ):
+            raise ValueError(
+                "The state was saved by a model with a different engine or population"
+            )
+
+        if self.engine == "vector":
+            for name, values in state["agents"].items():
+                getattr(self.vector_engine, name)[:] = values
+            self.vector_engine.index_inoculation()
+            self.vector_engine.agents_synced = False
+        else:
+            for name, values in state["agents"].items():
+                for a, value in zip(self.get_agents(), values):
+                    setattr(a, name, value)
+            self.index_inoculation()
+
+        self.schedule.steps = state["steps"]
+        self.schedule.time = state["time"]
+        self.banned_count = state["banned_count"]
+        self.random.setstate(state["model_random"])
+        random.setstate(state["global_random"])
+        np.random.set_state(state["numpy_random"])
+        self.draws.rng.bit_generator.state = state["draws_rng"]
+        self.model_data_collector.model_vars = copy.deepcopy(state["model_vars"])
+        self.agent_data_collector.set_state(state["agent_data"])
+        if self.convergence is not None and state["convergence"] is not None:
+            self.convergence.set_state(state["convergence"])
+
+    def save_checkpoint(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Write next to the target first so a run killed mid-write keeps its previous checkpoint
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as fp:
+            pickle.dump(self.get_state(), fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+    def load_checkpoint(self, path):
+        with open(path, "rb") as fp:
+            self.set_state(pickle.load(fp))
+
     def get_banned_count(self):
         temp = self.banned_count
         self.banned_count = 0
@@ -0,0 +1,360 @@
+import json
+import math
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+
+import config
+from csr_graph import SharedCSRGraph, attach_shared_graph
+from results_store import PARAMETER_TAGS, ResultsStore, format_parameter
+from run_cache import RunCache, get_run_key, get_run_variant
+from social_model import SocialModel
+from utils import load_graph
+
+
+# pid and startup time of a worker process, set by init_worker
+WORKER = None
+
+
+def init_worker(pool_started):
+    """
+    Records how long the worker took to be ready to run, from the start of
+    the pool (process creation and the imports of this module)
+    """
+    global WORKER
+    WORKER = {"pid": os.getpid(), "startup_seconds": time.time() - pool_started}
+
+
+def get_run_name(params, swept):
+    """
+    Args:
+        params (dict): SocialModel arguments of the run
+        swept (list): names of the parameters which vary across the sweep
+
+    Returns:
+        str: name of the run, e.g. 3_bfp=0.3 as passed to get_MIM_df
+    """
+    tags = [
+        f"{PARAMETER_TAGS[key]}={format_parameter(params[key])}"
+        for key in swept
+        if key != "exp"
+    ]
+    return "_".join([str(params["exp"])] + tags)
+
+
+def build_runs(grid=None, defaults=None, simulation_number=None):
+    """
+    Expands the parameter grid into the list of independent runs
+
+    Returns:
+        list[dict]: each run has an id, its folder name, its seed and the SocialModel arguments
+    """
+    grid = config.sweep_grid if grid is None else grid
+    defaults = config.sweep_defaults if defaults is None else defaults
+    if simulation_number is None:
+        simulation_number = config.simulation_number
+
+    swept = [key for key, values in grid.items() if len(values) > 1 or key == "exp"]
+
+    runs = []
+    for values in product(*grid.values()):
+        params = dict(defaults)
+        params.update(zip(grid.keys(), values))
+        name = get_run_name(params, swept)
+
+        for seed in range(simulation_number):
+            runs.append(
+                {"id": f"{name}/{seed}", "name": name, "seed": seed, "params": params}
+            )
+    return runs
+
+
+def append_manifest(manifest_path, entry):
+    with open(manifest_path, "a") as fp:
+        fp.write(json.dumps(entry) + "\n")
+        fp.flush()
+        os.fsync(fp.fileno())
+
+
+def group_branches(runs):
+    """
+    Groups the runs which only differ in their activation_delay, sorted by it
+
+    Returns:
+        list[list[dict]]
+    """
+    groups = {}
+    for run in runs:
+        params = {k: v for k, v in run["params"].items() if k != "activation_delay"}
+        key = (json.dumps(params, sort_keys=True), run["seed"])
+        groups.setdefault(key, []).append(run)
+
+    return [
+        sorted(group, key=lambda run: run["params"]["activation_delay"])
+        for group in groups.values()
+    ]
+
+
+def get_model_params(run, **params):
+    """
+    Args:
+        params: overrides of the run's SocialModel arguments
+
+    Returns:
+        dict: every SocialModel argument of the run but the graph and the seed
+    """
+    return {
+        "engine": config.engine,
+        **run["params"],
+        **params,
+        "from_scratch": True,
+        "param_index": run["seed"],
+        "collect_agent_data": True,
+    }
+
+
+def build_model(G, run, **params):
+    # Initialise the agents based on the agent_parameters
+    return SocialModel(G, seed=run["seed"], **get_model_params(run, **params))
+
+
+def execute_run(run, graph_handle):
+    """
+    Simulates a single run and writes its model/agent results, executed in a worker process
+
+    Args:
+        graph_handle (dict): SharedCSRGraph.handle of the network published by the sweep
+    """
+    G = attach_shared_graph(graph_handle)
+    return finish_run(run, build_model(G, run))
+
+
+def execute_branches(runs, graph_handle):
+    """
+    Simulates runs which only differ in their activation_delay (see
+    group_branches) from one shared trunk: the bans only start at step
+    activation_delay - 1, up to which every run follows the same trajectory,
+    so the trunk is stepped once without any ban and its state is forked into
+    each run at that step. Every run gives the same results as execute_run.
+
+    Runs without siblings, and runs of experiments without bans (where
+    activation_delay has no effect), have no trunk to share and are simply
+    executed on their own.
+
+    Returns:
+        dict: run id -> model_df
+    """
+    if len(runs) == 1 or runs[0]["params"]["exp"] != 2:
+        return {run["id"]: execute_run(run, graph_handle) for run in runs}
+
+    G = attach_shared_graph(graph_handle)
+    trunk = build_model(G, runs[0], activation_delay=math.inf)
+
+    model_dfs = {}
+    for run in runs:
+        fork_step = min(max(run["params"]["activation_delay"] - 1, 0), config.simulation_periods)
+        while trunk.schedule.steps < fork_step and not trunk.converged:
+            trunk.step()
+
+        social_model = build_model(G, run)
+        social_model.set_state(trunk.get_state())
+        model_dfs[run["id"]] = finish_run(run, social_model)
+
+    return model_dfs
+
+
+def get_sweep_path(run, name):
+    """
+    Returns:
+        str: the name ("store", "cache" or "checkpoints") directory under
+            the results_path of the sweep the run belongs to
+    """
+    return os.path.join(run.get("results_path", config.results_path), name)
+
+
+def get_checkpoint_path(run):
+    # By run key when there is one, a checkpoint left by a run with other
+    # parameters or config under the same id is then never resumed
+    return os.path.join(
+        get_sweep_path(run, "checkpoints"), f"{run.get('key', run['id'])}.pkl"
+    )
+
+
+def finish_run(run, social_model):
+    """
+    Steps the model to config.simulation_periods and writes its results
+    """
+    checkpoint = get_checkpoint_path(run)
+
+    # Resume a run which was interrupted from its latest checkpoint
+    if os.path.exists(checkpoint):
+        social_model.load_checkpoint(checkpoint)
+
+    while (
+        social_model.schedule.steps < config.simulation_periods
+        and not social_model.converged
+    ):
+        social_model.step()
+        steps = social_model.schedule.steps
+        if config.checkpoint_interval and steps % config.checkpoint_interval == 0:
+            social_model.save_checkpoint(checkpoint)
+
+    return write_results(run, social_model)
+
+
+def write_results(run, social_model):
+    """
+    Writes the results of a finished run and drops its checkpoint
+    """
+    checkpoint = get_checkpoint_path(run)
+    model_df = social_model.get_model_vars_dataframe(
+        pad_to=config.simulation_periods if config.convergence_pad else None
+    )
+    ResultsStore(get_sweep_path(run, "store")).write_run(
+        run["params"],
+        run["variant"],
+        run["seed"],
+        model_df,
+        social_model.agent_data_collector.get_agent_vars_dataframe(),
+    )
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    if social_model.converged:
+        model_df.attrs["converged_step"] = social_model.convergence.converged_step
+    if WORKER is not None:
+        model_df.attrs["worker"] = WORKER
+    return model_df
+
+
+def run_sweep(
+    runs=None,
+    results_path=None,
+    network_path=None,
+    workers=None,
+    branching=None,
+):
+    """
+    Runs every run which is not in the RunCache yet on a pool of worker
+    processes, so that an interrupted sweep resumes where it stopped and a run
+    is never recomputed for the same parameters, config and network (failed
+    runs are retried). Every attempt is recorded in results_path/manifest.jsonl,
+    the results, cache and checkpoints go to results_path as well (see config)
+
+    Args:
+        branching (bool): run the runs which only differ in their
+            activation_delay together with execute_branches,
+            config.sweep_branching by default
+
+    Returns:
+        dict: run id -> status for the runs attempted by this call
+    """
+    # Only needed here, the workers do not pay for importing it
+    from tqdm import tqdm
+
+    runs = build_runs() if runs is None else runs
+    results_path = config.results_path if results_path is None else results_path
+    network_path = config.network_path if network_path is None else network_path
+    workers = config.sweep_workers if workers is None else workers
+    workers = workers or os.cpu_count()
+    branching = config.sweep_branching if branching is None else branching
+
+    os.makedirs(results_path, exist_ok=True)
+    manifest_path = os.path.join(results_path, "manifest.jsonl")
+
+    # Publish the network once, every worker attaches to the same shared copy
+    csr = load_graph(network_path, sep=",", whole=True, as_networkx=False)
+
+    # Key every run by all it depends on
+    fingerprint = csr.fingerprint()
+    for run in runs:
+        run["results_path"] = results_path
+        model_params = get_model_params(run)
+        run["key"] = get_run_key(model_params, run["seed"], fingerprint)
+        run["variant"] = get_run_variant(model_params, fingerprint)
+
+    store = ResultsStore(os.path.join(results_path, "store"))
+    cache = RunCache(os.path.join(results_path, "cache"))
+    pending = [run for run in runs if run["key"] not in cache]
+    print(f"{len(runs) - len(pending)} of {len(runs)} runs already completed")
+
+    outcomes = {}
+    worker_startups = {}
+    with SharedCSRGraph(csr) as shared_graph, ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker, initargs=(time.time(),)
+    ) as executor:
+        if branching:
+            futures = {
+                executor.submit(execute_branches, group, shared_graph.handle): group
+                for group in group_branches(pending)
+            }
+        else:
+            futures = {
+                executor.submit(execute_run, run, shared_graph.handle): [run]
+                for run in pending
+            }
+
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            group = futures[future]
+            try:
+                model_dfs = future.result()
+                if not branching:
+                    model_dfs = {group[0]["id"]: model_dfs}
+                error = None
+            except Exception:
+                model_dfs, error = {}, traceback.format_exc()
+
+            for run in group:
+                entry = {
+                    "id": run["id"],
+                    "key": run["key"],
+                    "variant": run["variant"],
+                    "seed": run["seed"],
+                    "params": run["params"],
+                }
+                try:
+                    if error is not None:
+                        raise RuntimeError(error)
+                    # Fold the run into its parameter combination's aggregate,
+                    # only this process writes them
+                    store.update_aggregate(
+                        run["params"],
+                        run["variant"],
+                        run["seed"],
+                        model_dfs[run["id"]],
+                        config.aggregate_reservoir_size,
+                        # Whether or not the stored series are padded
+                        num_steps=config.simulation_periods,
+                    )
+                    cache.add(
+                        run["key"],
+                        store.get_run_path(run["params"], run["variant"], run["seed"]),
+                        id=run["id"],
+                        seed=run["seed"],
+                        params=run["params"],
+                    )
+                    entry["status"] = "completed"
+                    worker = model_dfs[run["id"]].attrs.get("worker")
+                    if worker is not None:
+                        worker_startups[worker["pid"]] = worker["startup_seconds"]
+                    # Step at which the run stopped early, if it converged
+                    converged_step = model_dfs[run["id"]].attrs.get("converged_step")
+                    if converged_step is not None:
+                        entry["converged_step"] = converged_step
+                except Exception:
+                    entry["status"] = "failed"
+                    entry["error"] = error or traceback.format_exc()
+                    print(f"{run['id']} failed:\n{entry['error']}")
+
+                append_manifest(manifest_path, entry)
+                outcomes[run["id"]] = entry["status"]
+
+    if worker_startups:
+        startups = list(worker_startups.values())
+        print(
+            f"Worker startup over {len(startups)} workers: "
+            f"mean {sum(startups) / len(startups):.3f}s, max {max(startups):.3f}s"
+        )
+    return outcomes
@@ -1,3 +1,5 @@
+import hashlib
+import json
 import os
 import random
 
@@ -5,9 +7,9 @@ import networkx as nx
 import numpy as np
 import pandas as pd
 from numpy.random import binomial
-from scipy.stats import beta
 
 import config
+from csr_graph import CSRGraph
 
 
 def convert_csv_to_graph(file: str, sep=" ", whole=False):
@@ -26,6 +28,65 @@ def convert_csv_to_graph(file: str, sep=" ", whole=False):
         return ego_net
 
 
+def load_graph(file: str, sep=" ", whole=False, as_networkx=True):
+    """
+    Cached counterpart of convert_csv_to_graph: the first call converts the
+    edge list into a binary CSR next to the source file, later calls
+    memory-map it as long as the source file's size and mtime (or, failing
+    that, its sha256) still match the ones it was built from
+
+    Args:
+        as_networkx (bool): return an nx.DiGraph view rather than the CSRGraph
+
+    Returns:
+        nx.DiGraph or CSRGraph: nodes are relabelled to 0..n-1 in sorted order
+            in the CSRGraph, its node_ids hold the original labels
+    """
+    file_name, _ = os.path.splitext(file)
+    cache_path = f"{file_name}{'' if whole else '_ego'}.csr"
+    meta_path = os.path.join(cache_path, "meta.json")
+
+    stat = os.stat(file)
+    meta = {"size": stat.st_size, "mtime": stat.st_mtime, "sep": sep, "whole": whole}
+
+    cached_meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path) as fp:
+            cached_meta = json.load(fp)
+
+    valid = cached_meta is not None and all(
+        cached_meta.get(key) == value for key, value in meta.items()
+    )
+    if not valid and cached_meta is not None:
+        # The file may only have been touched, compare its content
+        meta["sha256"] = file_hash(file)
+        valid = all(
+            cached_meta.get(key) == meta[key] for key in ("size", "sha256", "sep", "whole")
+        )
+
+    if valid:
+        meta["sha256"] = cached_meta["sha256"]
+    else:
+        G = convert_csv_to_graph(file, sep=sep, whole=whole)
+        CSRGraph.from_networkx(G, relabel=True).save(cache_path)
+        meta["sha256"] = meta.get("sha256") or file_hash(file)
+
+    if cached_meta != meta:
+        with open(meta_path, "w") as fp:
+            json.dump(meta, fp)
+
+    csr = CSRGraph.load(cache_path)
+    return csr.to_networkx() if as_networkx else csr
+
+
+def file_hash(file: str):
+    sha256 = hashlib.sha256()
+    with open(file, "rb") as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
 def get_intervals(lower, upper, n):
     """
     Args:
@@ -61,6 +122,41 @@ def compute_ab(mu):
     return a, b
 
 
+def beta_mean(a, b):
+    """
+    Closed-form mean of Beta(a, b), equal to scipy's beta.mean except that
+    invalid parameters (a <= 0 or b <= 0, or nan) give 0 instead of nan
+
+    Args:
+        a (float)
+        b (float)
+
+    Returns:
+        float: the opinion a / (a + b)
+    """
+    if a > 0 and b > 0:
+        return a / (a + b)
+    return 0
+
+
+def beta_means(a, b):
+    """
+    Element-wise mean of Beta(a, b), equal to scipy's beta.mean except that
+    invalid parameters (a <= 0 or b <= 0) give 0 instead of nan
+
+    Args:
+        a (np.ndarray)
+        b (np.ndarray)
+
+    Returns:
+        np.ndarray: the opinions a / (a + b)
+    """
+    valid = (a > 0) & (b > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = np.where(valid, a / (a + b), 0.0)
+    return means
+
+
 def coin_flip(prob: float = config.communication_speed) -> bool:
     """
     A single sample from the Bernoulli distribution
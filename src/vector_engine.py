@@ -0,0 +1,219 @@
+import numpy as np
+
+import config
+from agent_type import AgentType
+from inoculation_index import InoculationIndex
+from social_agent import Bot, BotFollower
+from utils import beta_means, compute_ab
+
+
+class VectorEngine:
+    """
+    Struct-of-arrays counterpart of stepping every SocialAgent through mesa.
+
+    The state of agent i lives at index i (its unique_id) of a set of numpy
+    arrays, and the network is held as a CSR adjacency, so that one step
+    updates the whole population with array operations. The update rules are
+    the ones of SocialAgent.step, update_belief and learn_truth, the bots'
+    flooding, the exp 2 ban/sleep cycle and the exp 3 inoculation filter.
+
+    The only behavioural difference is the activation order: the object engine
+    updates agents one after another in a random order, so that later agents
+    may already see this step's beliefs of earlier ones, whereas here every
+    agent reads its neighbors' beliefs from the start of the step.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+        agents = sorted(model.schedule.agents, key=lambda a: a.unique_id)
+        num_agents = len(agents)
+        assert [a.unique_id for a in agents] == list(range(num_agents))
+        self.num_agents = num_agents
+
+        self.a = np.array([a.a for a in agents], dtype=float)
+        self.b = np.array([a.b for a in agents], dtype=float)
+        self.agent_type = np.array([a.agent_type for a in agents], dtype=np.int8)
+        self.exp = np.array([a.exp for a in agents])
+        self.banned = np.array([a.banned for a in agents], dtype=bool)
+        self.sleep_count = np.array([a.sleep_count for a in agents], dtype=np.int64)
+        self.inoculated = np.array([a.inoculated for a in agents], dtype=bool)
+        self.influence_of_friends = np.array(
+            [a.influence_of_friends for a in agents], dtype=float
+        )
+        self.flooding_capacity = np.array(
+            [a.flooding_capacity if isinstance(a, Bot) else 0 for a in agents],
+            dtype=float,
+        )
+        self.inoculation_low = np.array(
+            [a.inoculation_range[0] if a.inoculated else 0 for a in agents], dtype=float
+        )
+        self.inoculation_high = np.array(
+            [a.inoculation_range[1] if a.inoculated else 0 for a in agents], dtype=float
+        )
+
+        self.is_bot = np.array([isinstance(a, Bot) for a in agents], dtype=bool)
+        self.is_left_bot = self.agent_type == AgentType.LWB
+        self.is_right_bot = self.agent_type == AgentType.RWB
+
+        # Friendship edges, the bots are not part of the network and have none.
+        # Both are the graph's own arrays, shared by the workers of a sweep
+        self.edge_rows = model.csr.row_ids()
+        self.edge_cols = model.csr.indices
+
+        # Bot edges, one per (bot follower, followed bot), attended to as a block
+        followers = [a for a in agents if isinstance(a, BotFollower)]
+        self.bot_rows = np.array(
+            [f.unique_id for f in followers for _ in f.bot_followed], dtype=np.int64
+        )
+        self.bot_cols = np.array(
+            [b for f in followers for b in f.bot_followed], dtype=np.int64
+        )
+
+        self.index_inoculation()
+
+        self.truth_a, self.truth_b = compute_ab(config.truth)
+
+        # Whether the agent objects hold the arrays' state (see sync_agents)
+        self.agents_synced = True
+
+    def index_inoculation(self):
+        """
+        Numbers the inoculation ranges once, so that each step only builds
+        the (ranges x agents) masks of the InoculationIndex and looks the
+        edges up in them
+        """
+        self.any_inoculated = bool(self.inoculated.any())
+        if not self.any_inoculated:
+            self.inoculation = None
+            return
+
+        self.inoculation = InoculationIndex(
+            self.inoculated, self.inoculation_low, self.inoculation_high
+        )
+
+    def opinions(self):
+        return beta_means(self.a, self.b)
+
+    def step(self):
+        schedule = self.model.schedule
+        opinions = self.opinions()
+        banned = self.banned.copy()
+
+        # Exp 2: agents holding too extreme an opinion get banned for a while
+        ban_check = (
+            (self.exp == 2)
+            & (schedule.steps >= (self.model.activation_delay - 1))
+            & ~(
+                (config.not_ban_range[0] < opinions)
+                & (opinions < config.not_ban_range[1])
+            )
+        )
+        timer = self.model.timer
+        with timer.phase("ban"):
+            self.ban(ban_check)
+
+        update = ~ban_check
+        with timer.phase("belief_update"):
+            self.update_beliefs(update & ~self.is_bot, opinions, banned)
+        with timer.phase("flooding"):
+            self.flood(update & self.is_bot)
+
+        schedule.steps += 1
+        schedule.time += 1
+        self.agents_synced = False
+
+    def ban(self, ban_check):
+        newly_banned = ban_check & ~self.banned
+        asleep = ban_check & self.banned & (self.sleep_count > 0)
+        waking = ban_check & self.banned & (self.sleep_count <= 0)
+
+        self.banned[newly_banned] = True
+        self.model.banned_count += int(newly_banned.sum())
+        self.sleep_count[newly_banned | asleep] -= 1
+
+        # Reset the woken up agents' beliefs into the acceptable range
+        mu = self.model.draws.rng.uniform(0.2, 0.8, int(waking.sum()))
+        self.a[waking], self.b[waking] = compute_ab(mu)
+        self.banned[waking] = False
+        self.sleep_count[waking] = config.agent_sleep_count
+
+    def update_beliefs(self, update, opinions, banned):
+        """
+        Vectorised SocialAgent.update_belief for the agents in the update mask
+        """
+        draws = self.model.draws
+
+        # Neighbors an agent pays attention to, banned accounts are not heard
+        edge_mask = draws.edge_attention & ~banned[self.edge_cols]
+
+        # Bot followers additionally listen to all of their bots by chance
+        bot_mask = draws.bot_attention[self.bot_rows]
+
+        # Inoculated agents ignore those outside their inoculation range
+        if self.any_inoculated:
+            in_range = self.inoculation.masks(opinions)
+            filter_edges = self.inoculation.filter_edges
+            edge_mask &= filter_edges(in_range, self.edge_rows, self.edge_cols)
+            bot_mask &= filter_edges(in_range, self.bot_rows, self.bot_cols)
+
+        count = np.zeros(self.num_agents)
+        sum_a = np.zeros(self.num_agents)
+        sum_b = np.zeros(self.num_agents)
+        for rows, cols, mask in (
+            (self.edge_rows, self.edge_cols, edge_mask),
+            (self.bot_rows, self.bot_cols, bot_mask),
+        ):
+            rows = rows[mask]
+            cols = cols[mask]
+            count += np.bincount(rows, minlength=self.num_agents)
+            sum_a += np.bincount(rows, weights=self.a[cols], minlength=self.num_agents)
+            sum_b += np.bincount(rows, weights=self.b[cols], minlength=self.num_agents)
+
+        w = np.where(count > 0, self.influence_of_friends, 0)
+        count[count == 0] = 1
+        as_from_neighbors = sum_a / count
+        bs_from_neighbors = sum_b / count
+
+        # learn_truth: a signal from the unbiased source with probability 0.5
+        truth_a = np.where(draws.truth_signal, self.truth_a, 0)
+        truth_b = np.where(draws.truth_signal, self.truth_b, 0)
+
+        a = ((1 - w) * (self.a + truth_a)) + (w * as_from_neighbors)
+        b = ((1 - w) * (self.b + truth_b)) + (w * bs_from_neighbors)
+
+        self.a = np.where(update, a, self.a)
+        self.b = np.where(update, b, self.b)
+
+    def flood(self, update):
+        """
+        Vectorised LeftWingBot/RightWingBot.update_belief for the bots in the update mask
+        """
+        left = update & self.is_left_bot
+        right = update & self.is_right_bot
+        self.b[left] += self.flooding_capacity[left]
+        self.a[right] += self.flooding_capacity[right]
+
+    def sync_agents(self):
+        """
+        Copy the array state back onto the agent objects, which are not
+        updated while this engine is stepping. SocialModel.get_agent and
+        get_agents call this, it only copies when the arrays have changed
+        since the last time
+        """
+        if self.agents_synced:
+            return
+
+        a = self.a.tolist()
+        b = self.b.tolist()
+        banned = self.banned.tolist()
+        sleep_count = self.sleep_count.tolist()
+        inoculated = self.inoculated.tolist()
+        for agent in self.model.schedule.agents:
+            i = agent.unique_id
+            agent.a = a[i]
+            agent.b = b[i]
+            agent.banned = banned[i]
+            agent.sleep_count = sleep_count[i]
+            agent.inoculated = inoculated[i]
+        self.agents_synced = True
@@ -0,0 +1,32 @@
+import os
+import sys
+
+import networkx as nx
+import pytest
+
+# The simulation modules are imported flat, as from within src/
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from social_model import SocialModel  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def graph():
+    return nx.powerlaw_cluster_graph(400, 3, 0.5, seed=1).to_directed()
+
+
+def build_model(G, exp, seed=0, **params):
+    args = {
+        "seed": seed,
+        "exp": exp,
+        "flooding_capacity": 25,
+        "bot_follower_percentage": 0.3,
+        "activation_delay": 0,
+        "inoculation_rate": 0.5,
+        "inoculation_range": [0.2, 0.8],
+        "from_scratch": True,
+        "param_index": seed,
+        "collect_agent_data": True,
+        **params,
+    }
+    return SocialModel(G, **args)
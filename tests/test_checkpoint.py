@@ -0,0 +1,53 @@
+import pytest
+
+from conftest import build_model
+
+
+@pytest.mark.parametrize("engine", ["object", "vector"])
+@pytest.mark.parametrize("exp", [1, 2, 3])
+def test_resumed_run_is_identical(graph, tmp_path, engine, exp, capsys):
+    full = build_model(graph, exp, seed=3, engine=engine)
+    for _ in range(20):
+        full.step()
+
+    interrupted = build_model(graph, exp, seed=3, engine=engine)
+    for _ in range(8):
+        interrupted.step()
+    checkpoint = tmp_path / "run.pkl"
+    interrupted.save_checkpoint(checkpoint)
+
+    resumed = build_model(graph, exp, seed=3, engine=engine)
+    resumed.load_checkpoint(checkpoint)
+    for _ in range(12):
+        resumed.step()
+
+    assert resumed.schedule.steps == full.schedule.steps
+    assert resumed.get_model_vars_dataframe().equals(full.get_model_vars_dataframe())
+    assert (
+        resumed.agent_data_collector.get_agent_vars_dataframe()
+        .equals(full.agent_data_collector.get_agent_vars_dataframe())
+    )
+
+
+@pytest.mark.parametrize("engine", ["object", "vector"])
+def test_set_state_of_get_state_is_identity(graph, engine, capsys):
+    model = build_model(graph, 3, seed=1, engine=engine)
+    for _ in range(5):
+        model.step()
+    state = model.get_state()
+
+    copy = build_model(graph, 3, seed=1, engine=engine)
+    copy.set_state(state)
+    again = copy.get_state()
+
+    assert again.keys() == state.keys()
+    for name, values in state["agents"].items():
+        assert list(again["agents"][name]) == list(values)
+    for key in ("steps", "time", "banned_count", "model_random", "global_random"):
+        assert again[key] == state[key]
+
+
+def test_set_state_rejects_another_engine(graph):
+    state = build_model(graph, 1, engine="vector").get_state()
+    with pytest.raises(ValueError):
+        build_model(graph, 1, engine="object").set_state(state)
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from conftest import build_model
+
+
+def final_metrics(G, exp, engine, seeds=6, steps=40):
+    """
+    Returns:
+        np.ndarray: the metrics of the last step, averaged over the seeds
+    """
+    metrics = []
+    for seed in range(seeds):
+        model = build_model(G, exp, seed, engine=engine)
+        for _ in range(steps):
+            model.step()
+        metrics.append(list(model.metrics.values()))
+    return np.mean(metrics, axis=0)
+
+
+@pytest.mark.parametrize("exp", [1, 2, 3])
+def test_vector_engine_matches_object_engine_statistics(graph, exp, capsys):
+    # The engines differ in activation order and random streams, not in their
+    # update rules, so the averaged metrics must agree
+    object_metrics = final_metrics(graph, exp, "object")
+    vector_metrics = final_metrics(graph, exp, "vector")
+    np.testing.assert_allclose(vector_metrics, object_metrics, atol=0.08)
+
+
+def test_engines_ban_the_same_accounts_from_the_same_state(graph, capsys):
+    # The first ban check only depends on the initial opinions
+    banned = []
+    for engine in ("object", "vector"):
+        model = build_model(graph, 2, engine=engine)
+        for _ in range(2):
+            model.step()
+        banned.append(model.get_model_vars_dataframe()["accounts_banned"].tolist())
+    assert banned[0] == banned[1]
+    assert banned[0][1] > 0
+
+
+def test_vector_engine_agents_follow_the_arrays(graph, capsys):
+    model = build_model(graph, 2, engine="vector")
+    for _ in range(5):
+        model.step()
+
+    agents = sorted(model.get_agents(), key=lambda a: a.unique_id)
+    engine = model.vector_engine
+    np.testing.assert_array_equal([a.a for a in agents], engine.a)
+    np.testing.assert_array_equal([a.banned for a in agents], engine.banned)
+    assert model.get_agent(0).sleep_count == engine.sleep_count[0]
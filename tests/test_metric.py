@@ -0,0 +1,57 @@
+import math
+
+import numpy as np
+import pytest
+
+import config
+from metric import Metric
+from utils import get_intervals
+
+
+def reference_polarization(opinions):
+    """
+    The loop implementation Metric.polarization replaced
+    """
+    alpha = 0.5
+    groups = [np.array([]) for _ in range(config.belief_distribution_groups)]
+
+    intervals = get_intervals(min(opinions), max(opinions), len(groups))
+    for op in opinions:
+        for i, (low, high) in enumerate(intervals):
+            if low <= op <= high:
+                groups[i] = np.append(groups[i], op)
+                break
+
+    K = 1 / (2 * (0.5) ** (2 + alpha))
+    pols = []
+    for i in range(len(groups)):
+        for j in range(len(groups)):
+            i_ratio = len(groups[i]) / len(opinions)
+            j_ratio = len(groups[j]) / len(opinions)
+            with np.errstate(invalid="ignore"):
+                i_average = np.average(groups[i]) if len(groups[i]) else math.nan
+                j_average = np.average(groups[j]) if len(groups[j]) else math.nan
+            pols.append(K * i_ratio ** (1 + alpha) * j_ratio * abs(i_average - j_average))
+    return sum(0 if math.isnan(pol) else pol for pol in pols)
+
+
+@pytest.mark.parametrize(
+    "opinions",
+    [
+        np.random.default_rng(0).uniform(0, 1, 500),
+        np.random.default_rng(1).beta(0.5, 0.5, 500),
+        # Clusters leave some groups empty
+        np.concatenate([np.full(100, 0.1), np.full(50, 0.9), [0.5]]),
+        # Opinions on the interval end points
+        np.linspace(0, 1, 8),
+    ],
+)
+def test_polarization_matches_reference(opinions):
+    assert Metric.polarization(opinions) == pytest.approx(
+        reference_polarization(opinions.tolist()), rel=1e-12, abs=1e-12
+    )
+
+
+def test_polarization_of_two_equal_extreme_groups_is_one():
+    opinions = np.array([0.0] * 50 + [1.0] * 50)
+    assert Metric.polarization(opinions) == pytest.approx(1)
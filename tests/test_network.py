@@ -0,0 +1,32 @@
+import random
+
+import networkx as nx
+import pytest
+
+from network import TransitivityCounter, pick_five_nodes, rewire_edges
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_transitivity_counter_tracks_rewiring(seed):
+    G = nx.powerlaw_cluster_graph(300, 3, 0.3, seed=seed)
+    counter = TransitivityCounter(G)
+    assert counter.transitivity() == pytest.approx(nx.transitivity(G))
+
+    random.seed(seed)
+    nodes = list(G.nodes)
+    for _ in range(50):
+        picked = pick_five_nodes(G, nodes)
+        if picked is None:
+            break
+        x, w, y, z, _ = picked
+        rewire_edges(G, x, w, y, z, counter)
+        assert counter.transitivity() == pytest.approx(nx.transitivity(G))
+
+
+def test_transitivity_counter_ignores_existing_and_missing_edges():
+    G = nx.complete_graph(5)
+    counter = TransitivityCounter(G)
+    counter.add_edge(0, 1)
+    counter.remove_edge(0, 1)
+    counter.remove_edge(0, 1)
+    assert counter.transitivity() == pytest.approx(nx.transitivity(G))
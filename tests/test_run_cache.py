@@ -0,0 +1,102 @@
+import networkx as nx
+import pytest
+
+import config
+from csr_graph import CSRGraph
+from results_store import ResultsStore
+from run_cache import RunCache, get_run_key, get_run_variant
+from sweep import build_runs, get_model_params
+
+PARAMS = {
+    "exp": 3,
+    "flooding_capacity": 25,
+    "bot_follower_percentage": 0.3,
+    "activation_delay": 0,
+    "inoculation_rate": 0.2,
+    "inoculation_range": [0.2, 0.8],
+    "engine": "object",
+}
+
+
+@pytest.fixture(scope="module")
+def fingerprint():
+    G = nx.powerlaw_cluster_graph(100, 3, 0.5, seed=0).to_directed()
+    return CSRGraph.from_networkx(G).fingerprint()
+
+
+def test_key_is_canonical(fingerprint):
+    reordered = dict(reversed(list(PARAMS.items())))
+    as_tuple = {**PARAMS, "inoculation_range": (0.2, 0.8)}
+    key = get_run_key(PARAMS, 0, fingerprint)
+    assert get_run_key(reordered, 0, fingerprint) == key
+    assert get_run_key(as_tuple, 0, fingerprint) == key
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        {"flooding_capacity": 5},
+        {"activation_delay": 100},
+        {"inoculation_rate": 0.5},
+        {"inoculation_range": [0.1, 0.9]},
+        {"engine": "vector"},
+    ],
+)
+def test_key_covers_every_parameter(fingerprint, change):
+    assert get_run_key({**PARAMS, **change}, 0, fingerprint) != get_run_key(
+        PARAMS, 0, fingerprint
+    )
+
+
+def test_key_covers_seed_config_and_graph(fingerprint, monkeypatch):
+    key = get_run_key(PARAMS, 0, fingerprint)
+    assert get_run_key(PARAMS, 1, fingerprint) != key
+
+    other_graph = CSRGraph.from_networkx(nx.path_graph(100).to_directed()).fingerprint()
+    assert get_run_key(PARAMS, 0, other_graph) != key
+
+    monkeypatch.setattr(config, "agent_sleep_count", config.agent_sleep_count + 1)
+    assert get_run_key(PARAMS, 0, fingerprint) != key
+
+
+def test_distinct_runs_get_distinct_store_locations(fingerprint, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "simulation_number", 3)
+    grid = {"exp": [1, 2, 3], "bot_follower_percentage": [0.3, 0.6]}
+    store = ResultsStore(str(tmp_path))
+
+    locations = {}
+    for engine in ("object", "vector"):
+        for run in build_runs(grid, {k: v for k, v in PARAMS.items() if k not in grid}):
+            model_params = get_model_params(run, engine=engine)
+            key = get_run_key(model_params, run["seed"], fingerprint)
+            variant = get_run_variant(model_params, fingerprint)
+            path = store.get_run_path(run["params"], variant, run["seed"])
+            locations.setdefault(path, set()).add(key)
+
+    assert len(locations) == 2 * 6 * 3
+    assert all(len(keys) == 1 for keys in locations.values())
+
+
+def test_variant_is_shared_by_the_seeds_of_a_combination(fingerprint):
+    run = {"params": PARAMS, "seed": 0}
+    variants = {
+        get_run_variant(get_model_params({**run, "seed": seed}), fingerprint)
+        for seed in range(5)
+    }
+    assert len(variants) == 1
+
+
+def test_cache_lookups_survive_reloading(tmp_path):
+    cache = RunCache(str(tmp_path))
+    cache.add("a", "store/x", id="1/0")
+    assert "a" in RunCache(str(tmp_path))
+    assert "b" not in RunCache(str(tmp_path))
+
+
+def test_rewritten_location_is_no_longer_cached(tmp_path):
+    cache = RunCache(str(tmp_path))
+    cache.add("a", "store/x")
+    cache.add("b", "store/x")
+    reloaded = RunCache(str(tmp_path))
+    assert "a" not in reloaded
+    assert reloaded.get("b")["path"] == "store/x"